@@ -0,0 +1,245 @@
+# Bulk audit of verified members
+# Streams the members of a guild from the Discord API page by page, checks that the Habbo account named
+# like each verified member (the nickname set on verification) still exists, and reports or removes the
+# role of those that don't. Members whose role is removed also lose their verified identity when the account
+# it names is gone too, so they can't get the role back in another guild without a code. The progress is saved in the store after every chunk, so an interrupted
+# audit resumes where it stopped
+#
+# Offline usage: python audit.py GUILD_ID [--strip] [--restart]
+
+import argparse
+import asyncio
+import csv
+import os
+import time
+
+import discord
+from dotenv import load_dotenv
+
+from config import (VERIFIED_ROLE, CHANGE_NICKNAME, AUDIT_CHUNK_SIZE, AUDIT_CONCURRENCY, AUDIT_RATE_LIMIT, AUDIT_PROGRESS_INTERVAL,
+                    AUDIT_REPORT_DIR)
+from habbo_api import HabboAPIError, RateLimiter
+
+# Result of checking one member: the account exists with the same name, doesn't exist (deleted or
+# renamed), exists with a different spelling, or couldn't be checked
+OK, MISSING, MISMATCH, ERROR = 'ok', 'missing', 'mismatch', 'errors'
+
+# Members scanned between checkpoints when few of them are verified (one page of the members API)
+SCAN_CHECKPOINT = 1000
+
+
+def new_checkpoint(strip):
+    return {
+        'after': 0,  # Id of the last member scanned, members are listed in id order
+        'scanned': 0,
+        'checked': 0,
+        OK: 0,
+        MISSING: 0,
+        MISMATCH: 0,
+        ERROR: 0,
+        'stripped': 0,
+        'strip': strip,
+        'started_at': time.time()
+    }
+
+
+class MemberAudit:
+    # identities and hotels (HotelClients) are needed to forget the identities of stripped members
+    def __init__(self, guild, role, client, store, actions, identities=None, hotels=None, strip=False,
+                 chunk_size=AUDIT_CHUNK_SIZE, concurrency=AUDIT_CONCURRENCY, rate_limit=AUDIT_RATE_LIMIT,
+                 progress_interval=AUDIT_PROGRESS_INTERVAL, report_dir=AUDIT_REPORT_DIR):
+        self.guild = guild
+        self.role = role
+        self.client = client
+        self.store = store
+        self.actions = actions
+        self.identities = identities
+        self.hotels = hotels
+        self.strip = strip
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.progress_interval = progress_interval
+        self.report_dir = report_dir
+        self.checkpoint = None
+        self._limiter = RateLimiter(rate_limit)
+        self._semaphore = None
+        self._last_progress = 0.0
+
+    # CSV with every member that was flagged
+    @property
+    def report_path(self):
+        return os.path.join(self.report_dir, f"audit_{self.guild.id}.csv")
+
+    async def _check(self, member):
+        return await self._lookup(self.client, member.display_name)
+
+    async def _lookup(self, client, name):
+        async with self._semaphore:
+            await self._limiter.acquire()
+            try:
+                data = await client.get_user(name, cache=False)
+            except (HabboAPIError, ValueError) as e:
+                print(f"Error checking {name} during audit: {e}")
+                return ERROR, None
+        # Only a 404 comes back as an error, other failures raised HabboAPIError and count as errors
+        if not data or 'error' in data:
+            return MISSING, None
+        exact_name = data.get('name', name)
+        return (OK if exact_name == name else MISMATCH), exact_name
+
+    async def _process(self, chunk, writer):
+        results = await asyncio.gather(*(self._check(member) for member in chunk))
+        removals = []
+        forgotten = []
+        for member, (status, habbo_name) in zip(chunk, results):
+            self.checkpoint['checked'] += 1
+            self.checkpoint[status] += 1
+            if status in (MISSING, MISMATCH):
+                writer.writerow([member.id, str(member), member.display_name, status, habbo_name or ''])
+            if status == MISSING and self.strip:
+                removals.append(self.actions.edit_member(member, remove_role=self.role))
+                if self.identities is not None:
+                    forgotten.append(self._forget_identity(member))
+
+        for result in await asyncio.gather(*forgotten, return_exceptions=True):
+            if isinstance(result, Exception):
+                print(f"Error removing a verified identity during audit: {result}")
+
+        # Removals go through the per-guild action queue, which spaces them out
+        for result in await asyncio.gather(*removals, return_exceptions=True):
+            if isinstance(result, Exception):
+                print(f"Error removing role during audit: {result}")
+            else:
+                self.checkpoint['stripped'] += 1
+
+    # Forget the verified identity of a stripped member once the account it names is gone as well (the
+    # nickname may have been changed since, or the identity may be on another hotel)
+    async def _forget_identity(self, member):
+        identity = await self.identities.lookup(member.id)
+        if identity is None:
+            return
+        if identity['hotel'] == self.client.server and identity['habbo_name'] == member.display_name:
+            # The account that was just checked
+            status = MISSING
+        else:
+            status, _ = await self._lookup(self.hotels.client(identity['hotel']), identity['habbo_name'])
+        if status == MISSING:
+            await self.identities.forget([member.id])
+
+    async def _save(self, progress, done=False):
+        await self.store.save_audit_checkpoint(self.guild.id, None if done else self.checkpoint)
+        if progress is not None and (done or time.monotonic() - self._last_progress >= self.progress_interval):
+            self._last_progress = time.monotonic()
+            try:
+                await progress(self.checkpoint, done)
+            except Exception as e:
+                print(f"Error reporting audit progress: {e}")
+
+    # Run (or resume) the audit, progress(checkpoint, done) is awaited after chunks, returns the final counts
+    async def run(self, restart=False, progress=None):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        checkpoint = None if restart else await self.store.load_audit_checkpoint(self.guild.id)
+        # A saved audit of the other mode is started again from the beginning
+        resumed = checkpoint is not None and checkpoint['strip'] == self.strip
+        self.checkpoint = checkpoint if resumed else new_checkpoint(self.strip)
+
+        os.makedirs(self.report_dir, exist_ok=True)
+        with open(self.report_path, 'a' if resumed else 'w', newline='', encoding='utf-8') as report:
+            writer = csv.writer(report)
+            if not resumed:
+                writer.writerow(['member_id', 'member', 'nickname', 'status', 'habbo_name'])
+
+            chunk = []
+            scanned = 0
+            last_id = self.checkpoint['after']
+            async for member in self.guild.fetch_members(limit=None, after=discord.Object(id=last_id)):
+                scanned += 1
+                last_id = member.id
+                if member.get_role(self.role.id) is not None:
+                    chunk.append(member)
+                if len(chunk) >= self.chunk_size or scanned >= SCAN_CHECKPOINT:
+                    await self._process(chunk, writer)
+                    report.flush()
+                    self.checkpoint['scanned'] += scanned
+                    self.checkpoint['after'] = last_id
+                    await self._save(progress)
+                    chunk = []
+                    scanned = 0
+
+            await self._process(chunk, writer)
+            self.checkpoint['scanned'] += scanned
+            self.checkpoint['after'] = last_id
+
+        await self._save(progress, done=True)
+        return self.checkpoint
+
+
+def format_progress(checkpoint):
+    return (f"{checkpoint['scanned']} members scanned, {checkpoint['checked']} verified members checked: "
+            f"{checkpoint[OK]} ok, {checkpoint[MISSING]} not found, {checkpoint[MISMATCH]} name mismatch, "
+            f"{checkpoint[ERROR]} errors, {checkpoint['stripped']} roles removed")
+
+
+# Run an audit without the bot: logs in over REST only, no gateway connection is needed
+async def run_cli(guild_id, strip=False, restart=False):
+    from discord_actions import DiscordActionQueue
+    from habbo_api import HotelClients
+    from identity_index import IdentityIndex
+    from storage import open_store
+
+    if strip and not CHANGE_NICKNAME:
+        # Members are matched to accounts by the nickname set on verification, without it most would be removed
+        print("--strip needs CHANGE_NICKNAME = True, members keep their own nicknames so they can't be matched "
+              "to a Habbo account")
+        return None
+
+    load_dotenv()
+    token = os.environ.get('DISCORD_TOKEN')
+    if token is None:
+        raise ValueError("Discord token not found in environment variables")
+
+    store = open_store()
+    hotels = HotelClients()
+    # Listing the members of a guild needs the members intent
+    intents = discord.Intents.default()
+    intents.members = True
+    client = discord.Client(intents=intents)
+    await store.start()
+    try:
+        async with client:
+            await client.login(token)
+            guild = await client.fetch_guild(guild_id)
+            role = discord.utils.get(guild.roles, name=VERIFIED_ROLE)
+            if role is None:
+                print(f"Role {VERIFIED_ROLE} doesn't exist in {guild.name}")
+                return None
+            hotel = (await store.load_guild_hotels()).get(guild.id, hotels.default)
+
+            async def progress(checkpoint, done):
+                print(("Finished: " if done else "") + format_progress(checkpoint))
+
+            audit = MemberAudit(guild, role, hotels.client(hotel), store, DiscordActionQueue(), IdentityIndex(store),
+                                hotels, strip=strip)
+            print(f"Auditing {guild.name} on {hotel}" + (" (removing roles)" if strip else ""))
+            checkpoint = await audit.run(restart=restart, progress=progress)
+            print(f"Report written to {audit.report_path}")
+            return checkpoint
+    finally:
+        await hotels.close()
+        await store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that verified members still match a Habbo account")
+    parser.add_argument('guild_id', type=int)
+    parser.add_argument('--strip', action='store_true', help=f"Remove {VERIFIED_ROLE} from members whose account is gone")
+    parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint of an interrupted audit")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run_cli(args.guild_id, strip=args.strip, restart=args.restart))
+    except KeyboardInterrupt:
+        print("Audit interrupted, run the same command again to resume it")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+# Avatar image cache
+# Two tiers: an in-memory LRU bounded by bytes, backed by files on disk (also bounded by bytes, the
+# files found at startup are ordered by modification time). Old entries are revalidated with
+# ETag/If-Modified-Since, and the stale copy is used when habbo-imaging is slow
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from config import (AVATAR_CACHE_DIR, AVATAR_CACHE_MEMORY, AVATAR_CACHE_DISK, AVATAR_CACHE_MAX_AGE,
+                    AVATAR_STALE_TIMEOUT)
+from habbo_api import AVATAR_PARAMS, HabboAPIError
+
+
+class AvatarCache:
+    # clients is the HotelClients of the bot, avatars are downloaded from the hotel they belong to
+    def __init__(self, clients, directory=AVATAR_CACHE_DIR, memory_bytes=AVATAR_CACHE_MEMORY,
+                 disk_bytes=AVATAR_CACHE_DISK, max_age=AVATAR_CACHE_MAX_AGE, stale_timeout=AVATAR_STALE_TIMEOUT):
+        self.clients = clients
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.max_age = max_age
+        self.stale_timeout = stale_timeout
+        # key -> {'body': bytes, 'etag': str, 'last_modified': str, 'fetched_at': float}
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        # key -> bytes of its files on disk, least recently used first (disk reads and writes run in threads)
+        self._disk = OrderedDict()
+        self._disk_used = 0
+        self._disk_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.stale_served = 0
+        self.bytes_saved = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._scan_disk()
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.revalidated + self.stale_served
+        return {
+            'memory_entries': len(self._memory),
+            'memory_bytes': self._memory_used,
+            'disk_entries': len(self._disk),
+            'disk_bytes': self._disk_used,
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidated': self.revalidated,
+            'stale_served': self.stale_served,
+            'hit_rate': (lookups - self.misses) / lookups if lookups else 0.0,
+            'bytes_saved': self.bytes_saved
+        }
+
+    # Cache key for (server, exact name, render parameters)
+    def _key(self, server, name):
+        params = '&'.join(f"{k}={v}" for k, v in sorted(AVATAR_PARAMS.items()))
+        return hashlib.sha1(f"{server}|{name}|{params}".encode('utf-8')).hexdigest()
+
+    def _remember(self, key, entry):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_used -= len(old['body'])
+        self._memory[key] = entry
+        self._memory_used += len(entry['body'])
+        while self._memory_used > self.memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= len(evicted['body'])
+
+    # Index the avatars left on disk by earlier runs, oldest first, and delete those over the limit
+    def _scan_disk(self):
+        files = {}
+        for dir_entry in os.scandir(self.directory):
+            key, ext = os.path.splitext(dir_entry.name)
+            if ext not in ('.png', '.json') or not dir_entry.is_file():
+                continue
+            try:
+                stat = dir_entry.stat()
+            except OSError:
+                continue
+            size, mtime = files.get(key, (0, 0))
+            files[key] = (size + stat.st_size, max(mtime, stat.st_mtime))
+        for key, (size, _) in sorted(files.items(), key=lambda item: item[1][1]):
+            self._disk[key] = size
+            self._disk_used += size
+        with self._disk_lock:
+            self._prune_disk()
+
+    # Delete the least recently used avatars until the disk tier fits its limit (called with the lock held)
+    def _prune_disk(self):
+        while self._disk_used > self.disk_bytes and len(self._disk) > 1:
+            key, size = self._disk.popitem(last=False)
+            self._disk_used -= size
+            path = os.path.join(self.directory, key)
+            for ext in ('.png', '.json'):
+                try:
+                    os.remove(path + ext)
+                except OSError:
+                    pass
+
+    def _read_disk(self, key):
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path + '.json', 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            with open(path + '.png', 'rb') as f:
+                entry['body'] = f.read()
+        except (OSError, ValueError):
+            return None
+        with self._disk_lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+        return entry
+
+    def _write_disk(self, key, entry):
+        path = os.path.join(self.directory, key)
+        meta = {k: v for k, v in entry.items() if k != 'body'}
+        try:
+            # Write to temporary files first so a crash never leaves a half-written avatar
+            with open(path + '.png.tmp', 'wb') as f:
+                f.write(entry['body'])
+            with open(path + '.json.tmp', 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            os.replace(path + '.png.tmp', path + '.png')
+            os.replace(path + '.json.tmp', path + '.json')
+            size = os.path.getsize(path + '.png') + os.path.getsize(path + '.json')
+        except OSError as e:
+            print(f"Error saving avatar to cache: {e}")
+            return
+        with self._disk_lock:
+            self._disk_used += size - self._disk.pop(key, 0)
+            self._disk[key] = size
+            self._prune_disk()
+
+    async def _run_io(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def _store(self, key, entry):
+        self._remember(key, entry)
+        if self.directory:
+            await self._run_io(self._write_disk, key, entry)
+
+    def _new_entry(self, body, headers):
+        return {
+            'body': body,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'fetched_at': time.time()
+        }
+
+    # Get avatar PNG bytes for an exact Habbo name (on the default hotel when server isn't given)
+    async def get(self, name, server=None):
+        client = self.clients.client(server)
+        key = self._key(client.server, name)
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+        elif self.directory:
+            entry = await self._run_io(self._read_disk, key)
+            if entry is not None:
+                self._remember(key, entry)
+
+        if entry is not None and time.time() - entry['fetched_at'] < self.max_age:
+            self.hits += 1
+            self.bytes_saved += len(entry['body'])
+            return entry['body']
+
+        if entry is None:
+            self.misses += 1
+            status, body, headers = await client.fetch_avatar(name)
+            if status != 200:
+                raise HabboAPIError(f"Could not download avatar for {name} (status {status})")
+            await self._store(key, self._new_entry(body, headers))
+            return body
+
+        # Revalidate the old copy, falling back to it when imaging is slow or failing
+        try:
+            status, body, headers = await asyncio.wait_for(
+                client.fetch_avatar(name, entry.get('etag'), entry.get('last_modified')),
+                timeout=self.stale_timeout
+            )
+        except (HabboAPIError, asyncio.TimeoutError):
+            status = None
+
+        if status == 304:
+            self.revalidated += 1
+            self.bytes_saved += len(entry['body'])
+            entry = dict(entry, fetched_at=time.time())
+            await self._store(key, entry)
+            return entry['body']
+        if status == 200:
+            self.misses += 1
+            await self._store(key, self._new_entry(body, headers))
+            return body
+
+        self.stale_served += 1
+        self.bytes_saved += len(entry['body'])
+        return entry['body']
@@ -0,0 +1,73 @@
+# Benchmark: Habbo API polling throughput and event-loop lag
+# Runs N concurrent verifications against a local fake Habbo server and compares the
+# old blocking `requests.get` path with the pooled async client
+#
+# Usage: python benchmarks/bench_habbo_api.py [--concurrency 10 100 1000] [--duration 5] [--latency 0.05]
+
+import argparse
+import asyncio
+import time
+
+import requests
+
+from common import LoopLagMonitor
+from fake_habbo import FakeHabbo
+from habbo_api import HabboClient
+
+
+# Old path: synchronous request straight from the coroutine
+async def poll_blocking(base_url, name):
+    requests.get(f"{base_url}/api/public/users?name={name}").json()
+
+
+async def run_step(server, mode, concurrency, duration, interval):
+    # No hotel rate limit and no profile cache, so every poll is an HTTP request of the pooled client
+    client = HabboClient('habbo.com.br', base_url=server.base_url, rate_limit=0)
+    await client.start()
+    polls = 0
+    deadline = time.perf_counter() + duration
+
+    async def verification(index):
+        nonlocal polls
+        name = f"user{index}"
+        while time.perf_counter() < deadline:
+            if mode == 'async':
+                await client.get_user(name, cache=False)
+            else:
+                await poll_blocking(server.base_url, name)
+            polls += 1
+            await asyncio.sleep(interval)
+
+    monitor = LoopLagMonitor()
+    monitor.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(verification(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    lag = await monitor.stop()
+    await client.close()
+    return polls / elapsed, lag
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds per step')
+    parser.add_argument('--latency', type=float, default=0.05, help='Fake server latency in seconds')
+    parser.add_argument('--interval', type=float, default=0.0, help='Sleep between polls of one verification')
+    parser.add_argument('--modes', nargs='+', default=['blocking', 'async'], choices=['blocking', 'async'])
+    args = parser.parse_args()
+
+    server = FakeHabbo(latency=args.latency)
+    server.start_in_thread()
+    print(f"{'mode':<10}{'concurrency':>12}{'polls/s':>12}{'lag mean ms':>14}{'lag p99 ms':>12}{'lag max ms':>12}")
+    try:
+        for mode in args.modes:
+            for concurrency in args.concurrency:
+                rate, lag = await run_step(server, mode, concurrency, args.duration, args.interval)
+                print(f"{mode:<10}{concurrency:>12}{rate:>12.1f}{lag['mean_ms']:>14.2f}{lag['p99_ms']:>12.2f}{lag['max_ms']:>12.2f}")
+    finally:
+        server.stop_thread()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
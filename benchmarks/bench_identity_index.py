@@ -0,0 +1,82 @@
+# Benchmark: verified identity index
+# Imports identities from a CSV file into the SQLite store, looks up members that are cached in memory,
+# members that have to be read from the store and members that were never verified, and exports them again
+#
+# Usage: python benchmarks/bench_identity_index.py [--records 100000 1000000] [--lookups 20000]
+
+import argparse
+import asyncio
+import csv
+import os
+import random
+import tempfile
+import time
+
+import common  # noqa: F401 (adds the project folder to the import path)
+from identity_index import IdentityIndex, export_identities, import_identities
+from storage import IDENTITY_FIELDS, SQLiteVerificationStore
+
+HOTELS = ('habbo.com', 'habbo.com.br', 'habbo.es', 'habbo.de')
+FIRST_USER_ID = 10 ** 17
+
+
+def write_csv(path, records, now):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(IDENTITY_FIELDS)
+        for index in range(records):
+            writer.writerow((FIRST_USER_ID + index, HOTELS[index % len(HOTELS)], f"User{index}",
+                             now - random.uniform(0, 7 * 24 * 60 * 60)))
+
+
+async def lookup_rate(index, user_ids):
+    started = time.perf_counter()
+    for user_id in user_ids:
+        await index.lookup(user_id)
+    return len(user_ids) / (time.perf_counter() - started)
+
+
+async def run(records, lookups, cache_size):
+    directory = tempfile.mkdtemp()
+    csv_path = os.path.join(directory, 'identities.csv')
+    write_csv(csv_path, records, time.time())
+    store = SQLiteVerificationStore(os.path.join(directory, 'bench.db'))
+    await store.start()
+
+    started = time.perf_counter()
+    await import_identities(store, csv_path)
+    import_rate = records / (time.perf_counter() - started)
+
+    index = IdentityIndex(store, cache_size=cache_size)
+    hot = [FIRST_USER_ID + random.randrange(records) for _ in range(min(lookups, cache_size))]
+    # Fills the cache, then measures lookups of members already in it
+    await lookup_rate(index, hot)
+    rates = [await lookup_rate(index, hot)]
+    rates.append(await lookup_rate(index, [FIRST_USER_ID + random.randrange(records) for _ in range(lookups)]))
+    rates.append(await lookup_rate(index, [random.randrange(10 ** 6) for _ in range(lookups)]))
+
+    started = time.perf_counter()
+    await export_identities(store, os.path.join(directory, 'export.csv'))
+    export_rate = records / (time.perf_counter() - started)
+
+    size = os.path.getsize(os.path.join(directory, 'bench.db'))
+    await store.close()
+    return import_rate, rates, export_rate, size
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--records', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--lookups', type=int, default=20000)
+    parser.add_argument('--cache-size', type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{'records':>10}{'imports/s':>12}{'cached/s':>12}{'store/s':>12}{'unknown/s':>12}{'exports/s':>12}{'db MB':>8}")
+    for records in args.records:
+        import_rate, (cached, stored, unknown), export_rate, size = await run(records, args.lookups, args.cache_size)
+        print(f"{records:>10}{import_rate:>12.0f}{cached:>12.0f}{stored:>12.0f}{unknown:>12.0f}"
+              f"{export_rate:>12.0f}{size / 2 ** 20:>8.1f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
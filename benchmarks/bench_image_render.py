@@ -0,0 +1,111 @@
+# Benchmark: verification image rendering throughput and latency
+# Compares the old inline path (reload background and font, composite and encode on the event
+# loop for every image) with the ImageRenderer worker pool using preloaded assets, the pool with the
+# render cache when names repeat, and the size and encoding time of every PNG encoding mode
+#
+# Usage: python benchmarks/bench_image_render.py [--images 200] [--burst 20] [--workers 2] [--names 50]
+
+import argparse
+import asyncio
+import os
+import time
+from io import BytesIO
+
+from common import LoopLagMonitor, percentile
+from fake_habbo import make_png
+
+import image_renderer
+from image_renderer import ImageRenderer
+from PIL import Image, ImageDraw
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Old path: everything is reloaded and rendered synchronously inside the coroutine
+async def render_inline(avatar_bytes, habbo_user):
+    settings = image_renderer.load_settings()
+    avatar_img = Image.open(BytesIO(avatar_bytes))
+    img = image_renderer.load_background(settings)
+    draw = ImageDraw.Draw(img)
+    img.paste(avatar_img, (20, 0), avatar_img)
+    font = image_renderer.load_font(settings)
+    draw.text((200, 60), f"{habbo_user},", font=font, fill=settings['MAIN_TEXT_COLOR'])
+    draw.text((200, 90), settings['VERIFICATION_TEXT'], font=font, fill=settings['SECONDARY_TEXT_COLOR'])
+    buffer = BytesIO()
+    img.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+async def run(render, images, burst, names=None):
+    avatar = make_png()
+    latencies = []
+
+    async def one(index, requested_at):
+        # With names, users verify again (e.g. in another server) and the same image is requested
+        await render(avatar, f"User{index % names if names else index}")
+        latencies.append(time.perf_counter() - requested_at)
+
+    monitor = LoopLagMonitor()
+    monitor.start()
+    started = time.perf_counter()
+    # Images are requested in bursts, latency is measured from the moment the burst arrives
+    for first in range(0, images, burst):
+        requested_at = time.perf_counter()
+        await asyncio.gather(*(one(i, requested_at) for i in range(first, min(images, first + burst))))
+    elapsed = time.perf_counter() - started
+    lag = await monitor.stop()
+    return images / elapsed, latencies, lag
+
+
+def report(name, rate, latencies, lag):
+    print(f"{name:<20}{rate:>10.1f}{1000 * percentile(latencies, 50):>10.1f}"
+          f"{1000 * percentile(latencies, 99):>10.1f}{lag['max_ms']:>14.1f}")
+
+
+# Encoding time and size of the PNG for every compress level, with and without the palette
+def compare_encodings(images, levels):
+    avatar = make_png()
+    print(f"\n{'encoding':<20}{'ms/image':>10}{'KB/image':>10}")
+    for quantize in (False, True):
+        for level in levels:
+            settings = image_renderer.load_settings({'PNG_COMPRESS_LEVEL': level, 'IMAGE_QUANTIZE': quantize})
+            image_renderer.render_image(avatar, 'warmup', settings)
+            started = time.perf_counter()
+            size = sum(len(image_renderer.render_image(avatar, f"User{i}", settings)) for i in range(images))
+            elapsed = time.perf_counter() - started
+            name = f"level {level}" + (" + palette" if quantize else "")
+            print(f"{name:<20}{1000 * elapsed / images:>10.2f}{size / images / 1024:>10.1f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--images', type=int, default=200)
+    parser.add_argument('--burst', type=int, default=20, help='Renders requested at the same time')
+    parser.add_argument('--queue-size', type=int, default=8, help='Renderer queue size (backpressure)')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--names', type=int, default=50, help='Distinct users in the cached run')
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 6, 9], help='PNG compress levels to compare')
+    args = parser.parse_args()
+
+    # Asset paths in config.py are relative to the project folder
+    os.chdir(ROOT)
+    print(f"{'path':<20}{'images/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'loop lag ms':>14}")
+    report('inline (old)', *await run(render_inline, args.images, args.burst))
+
+    renderer = ImageRenderer(workers=args.workers, queue_size=args.queue_size, cache_bytes=0)
+    renderer.start()
+    # Warm up the worker processes before measuring
+    await asyncio.gather(*(renderer.render(make_png(), 'warmup') for _ in range(args.workers)))
+    report(f"pool x{args.workers}", *await run(renderer.render, args.images, args.burst))
+
+    renderer.cache_bytes = 64 * 1024 * 1024
+    renderer.hits = renderer.misses = 0
+    report('pool + cache', *await run(renderer.render, args.images, args.burst, args.names))
+    print(f"cache: {renderer.stats()}")
+    renderer.close()
+
+    compare_encodings(min(args.images, 50), args.levels)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,244 @@
+# Load test: the real verify, cancel and restart commands of bot.py at increasing concurrency
+# Commands run against the in-process fake Discord layer, and the scheduler, Habbo client, avatar cache
+# and render pool of the bot talk to a local fake Habbo server whose users set their code after a
+# random delay. Every step reports throughput, time-to-verify, event-loop lag, peak RSS and the
+# requests sent to Habbo and Discord, and --json writes the results for comparing releases.
+# With --profile-feed the bot subscribes to a local poller_service.py instead of polling on its own
+#
+# Usage: python benchmarks/bench_load.py [--steps 10 100 1000 10000] [--json results.json]
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+from common import LoopLagMonitor, percentile
+from fake_discord import FakeChannel, FakeContext, FakeGuild, FakeMember, FakeREST
+from fake_habbo import FakeHabbo
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+# Import bot.py with its store and avatar cache kept out of the project folder
+def load_bot(server, keep_rate_limits, guilds):
+    os.chdir(PROJECT_DIR)
+    os.environ.setdefault('DISCORD_TOKEN', 'load-test')
+    import bot
+    from storage import MemoryVerificationStore
+
+    bot.create_app()
+    bot.store = MemoryVerificationStore()
+    bot.identities.store = bot.store
+    # Pending verifications look their guild up by id
+    bot.bot.get_guild = guilds.get
+    bot.avatar_cache.directory = tempfile.mkdtemp(prefix='bench-avatars-')
+    client = bot.habbo_hotels.client()
+    client.base_url = server.base_url
+    if not keep_rate_limits:
+        # Measure the bot itself rather than the configured request budgets
+        bot.scheduler.rate = 10 ** 6
+        client.rate_limiter.rate = 0
+    return bot
+
+
+# Poller service talking to the fake Habbo server, and the bot subscribed to it
+async def start_profile_feed(bot, server, keep_rate_limits):
+    from poller_service import PollerService
+    from profile_source import FeedSource
+
+    service = PollerService(port=0)
+    client = service.hotels.client()
+    client.base_url = server.base_url
+    if not keep_rate_limits:
+        service.scheduler.rate = 10 ** 6
+        client.rate_limiter.rate = 0
+    await service.start()
+    bot.profile_source = FeedSource(port=service.port)
+    await bot.profile_source.start(bot.profile_changed)
+    while not bot.profile_source.connected:
+        await asyncio.sleep(0.01)
+    return service
+
+
+class Step:
+    def __init__(self, bot, size, guilds, rest, base_id):
+        self.bot = bot
+        self.size = size
+        self.rest = rest
+        self.guilds = [FakeGuild(rest, base_id + index, shard_id=index) for index in range(guilds)]
+        self.channels = {guild.id: FakeChannel(rest, guild=guild) for guild in self.guilds}
+        self.base_id = base_id
+        self.issued = {}
+        self.outcomes = {}
+        self.pending = set()
+        self.done = asyncio.Event()
+
+    def record(self, user_id, outcome):
+        if user_id in self.pending:
+            self.pending.discard(user_id)
+            self.outcomes[user_id] = (outcome, time.monotonic())
+            if not self.pending:
+                self.done.set()
+
+
+async def run_user(step, server, index, args):
+    bot = step.bot
+    user_id = step.base_id + 100000 + index
+    guild = step.guilds[index % len(step.guilds)]
+    member = FakeMember(guild, user_id, f"member{user_id}")
+    ctx = FakeContext(guild, step.channels[guild.id], member)
+    roll = random.random()
+    habbo_user = f"notfound{user_id}" if roll < args.not_found_rate else f"user{user_id}"
+
+    step.pending.add(user_id)
+    step.issued[user_id] = time.monotonic()
+    await bot.verify.callback(ctx, habbo_user)
+    entry = bot.active_verifications.get(user_id)
+    if entry is None:
+        return
+
+    roll = random.random()
+    delay = random.uniform(*args.motto_delay)
+    if roll < args.cancel_rate:
+        await asyncio.sleep(delay / 2)
+        await bot.cancel.callback(ctx)
+    elif roll < args.cancel_rate + args.restart_rate:
+        await asyncio.sleep(delay / 2)
+        await bot.restart.callback(ctx)
+        entry = bot.active_verifications.get(user_id)
+        if entry is not None:
+            server.schedule_motto(habbo_user, entry.code, delay / 2)
+    else:
+        server.schedule_motto(habbo_user, entry.code, delay)
+
+
+async def run_step(bot, server, size, index, args, steps, guilds):
+    rest = FakeREST(args.discord_latency)
+    step = Step(bot, size, args.guilds, rest, base_id=(index + 1) * 10 ** 9)
+    steps.append(step)
+    guilds.update((guild.id, guild) for guild in step.guilds)
+    habbo_before = dict(server.requests_by_path)
+
+    monitor = LoopLagMonitor()
+    monitor.start()
+    started = time.monotonic()
+    users = []
+    for user in range(size):
+        users.append(asyncio.create_task(run_user(step, server, user, args)))
+        await asyncio.sleep(args.ramp / size)
+    await asyncio.gather(*users)
+    try:
+        await asyncio.wait_for(step.done.wait(), timeout=args.timeout)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.monotonic() - started
+    lag = await monitor.stop()
+
+    # Drop what is left so the next step starts empty
+    for user_id in list(step.pending):
+        bot.remove_verification(user_id)
+
+    verify_times = [finished - step.issued[user_id] for user_id, (outcome, finished) in step.outcomes.items()
+                    if outcome == 'verified']
+    outcomes = {}
+    for outcome, _ in step.outcomes.values():
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    if step.pending:
+        outcomes['unfinished'] = len(step.pending)
+    return {
+        'concurrency': size,
+        'elapsed_s': round(elapsed, 3),
+        'verified_per_s': round(len(verify_times) / elapsed, 2) if elapsed else 0.0,
+        'verify_p50_s': round(percentile(verify_times, 50), 3),
+        'verify_p99_s': round(percentile(verify_times, 99), 3),
+        'outcomes': outcomes,
+        'loop_lag_mean_ms': round(lag['mean_ms'], 3),
+        'loop_lag_p99_ms': round(lag['p99_ms'], 3),
+        'loop_lag_max_ms': round(lag['max_ms'], 3),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'habbo_requests': {path: count - habbo_before.get(path, 0) for path, count in server.requests_by_path.items()},
+        'discord_requests': dict(rest.calls)
+    }
+
+
+async def main(args):
+    server = FakeHabbo(latency=args.habbo_latency, error_rate=args.habbo_error_rate)
+    server.start_in_thread()
+    guilds = {}
+    bot = load_bot(server, args.keep_rate_limits, guilds)
+
+    # Report finished verifications to the running step
+    steps = []
+    record_outcome = bot.record_outcome
+
+    def record(entry, outcome):
+        record_outcome(entry, outcome)
+        steps[-1].record(entry.user_id, outcome)
+
+    bot.record_outcome = record
+    bot.image_renderer.start()
+    bot.scheduler.start()
+    service = await start_profile_feed(bot, server, args.keep_rate_limits) if args.profile_feed else None
+
+    results = []
+    print(f"{'concurrency':>12}{'verified/s':>12}{'p50 s':>8}{'p99 s':>8}{'lag p99 ms':>12}{'rss MB':>8}"
+          f"{'habbo req':>11}{'discord req':>13}  outcomes")
+    try:
+        for index, size in enumerate(args.steps):
+            result = await run_step(bot, server, size, index, args, steps, guilds)
+            results.append(result)
+            print(f"{size:>12}{result['verified_per_s']:>12.1f}{result['verify_p50_s']:>8.2f}"
+                  f"{result['verify_p99_s']:>8.2f}{result['loop_lag_p99_ms']:>12.1f}{result['peak_rss_mb']:>8.0f}"
+                  f"{sum(result['habbo_requests'].values()):>11}{sum(result['discord_requests'].values()):>13}"
+                  f"  {result['outcomes']}")
+    finally:
+        if service is not None:
+            await bot.profile_source.close()
+            await service.close()
+        await bot.scheduler.stop()
+        await bot.habbo_hotels.close()
+        bot.image_renderer.close()
+        server.stop_thread()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(args), 'steps': results}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test of the bot commands with fake Discord and Habbo")
+    parser.add_argument('--steps', type=int, nargs='+', default=[10, 100, 1000, 10000],
+                        help='Concurrent verifications of each step')
+    parser.add_argument('--guilds', type=int, default=100, help='Guilds the verifications are spread over')
+    parser.add_argument('--ramp', type=float, default=2.0, help='Seconds over which the verify commands of a step arrive')
+    parser.add_argument('--timeout', type=float, default=120.0, help='Maximum seconds to wait for a step to finish')
+    parser.add_argument('--habbo-latency', type=float, default=0.05, help='Fake Habbo API latency in seconds')
+    parser.add_argument('--habbo-error-rate', type=float, default=0.0, help='Share of Habbo requests answered with 503')
+    parser.add_argument('--discord-latency', type=float, default=0.05, help='Fake Discord REST latency in seconds')
+    parser.add_argument('--motto-delay', type=float, nargs=2, default=[1.0, 10.0], metavar=('MIN', 'MAX'),
+                        help='Seconds users take to set their code (uniform)')
+    parser.add_argument('--not-found-rate', type=float, default=0.02, help='Share of users whose profile does not exist')
+    parser.add_argument('--cancel-rate', type=float, default=0.05, help='Share of users that cancel')
+    parser.add_argument('--restart-rate', type=float, default=0.05, help='Share of users that restart')
+    parser.add_argument('--keep-rate-limits', action='store_true',
+                        help='Keep HABBO_API_RATE_LIMIT and HOTEL_RATE_LIMIT instead of lifting them')
+    parser.add_argument('--profile-feed', action='store_true',
+                        help='Subscribe to a local poller service instead of polling from the bot')
+    parser.add_argument('--json', help='Write the results to this file')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,102 @@
+# Benchmark: memory used by each pending verification
+# Compares the previous dict entries (datetime expiry and the discord.py Message of the instructions)
+# with PendingVerification records. Members and channels live in the discord.py cache either way, so
+# only what the entries add on top of it is measured
+#
+# Usage: python benchmarks/bench_pending_memory.py [--entries 1000 10000 100000]
+
+import argparse
+import gc
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import discord
+from discord.state import ConnectionState
+
+import common  # noqa: F401 (adds the project folder to the import path)
+from metrics import NoopTrace
+from pending import PendingVerification
+from polling_policy import PollingState
+
+GUILDS = 50
+
+
+def make_state():
+    state = ConnectionState(dispatch=lambda *args: None, handlers={}, hooks={}, http=None)
+    guilds = [discord.Guild(data={'id': str(1000 + index), 'name': f"guild{index}"}, state=state)
+              for index in range(GUILDS)]
+    channels = [discord.TextChannel(state=state, guild=guild,
+                                    data={'id': str(2000 + index), 'name': 'verify', 'type': 0, 'position': 0})
+                for index, guild in enumerate(guilds)]
+    return state, channels
+
+
+# Instructions message as received from Discord when it is sent
+def make_message(state, channel, user_id, code):
+    return discord.Message(state=state, channel=channel, data={
+        'id': str(10 ** 17 + user_id),
+        'channel_id': str(channel.id),
+        'guild_id': str(channel.guild.id),
+        'type': 0,
+        'content': f"<@{user_id}> To verify User{user_id} on habbo.com.br, set your motto to {code} "
+                   f"within 5 minutes. Use !cancel to stop or !restart for a new code.",
+        'author': {'id': '1', 'username': 'verify-bot', 'discriminator': '0', 'avatar': None, 'bot': True},
+        'attachments': [], 'embeds': [], 'mentions': [], 'mention_roles': [], 'components': [],
+        'pinned': False, 'mention_everyone': False, 'tts': False, 'flags': 0,
+        'timestamp': '2024-01-01T00:00:00+00:00', 'edited_timestamp': None
+    })
+
+
+def make_dict(state, channel, user_id):
+    code = f"myt-{user_id % 10 ** 6:06d}"
+    return {
+        'habbo_user': f"User{user_id}",
+        'hotel': 'habbo.com.br',
+        'code': code,
+        'expires_at': datetime.now() + timedelta(seconds=300),
+        'channel': channel,
+        'member': None,
+        'message': make_message(state, channel, user_id, code),
+        'trace': NoopTrace(),
+        'polling': PollingState(),
+        'exact_name': f"User{user_id}"
+    }
+
+
+def make_record(state, channel, user_id):
+    code = f"myt-{user_id % 10 ** 6:06d}"
+    return PendingVerification(user_id, channel.guild.id, channel.id, 10 ** 17 + user_id, f"User{user_id}",
+                               'habbo.com.br', code, time.monotonic() + 300)
+
+
+# Bytes allocated per entry of a dictionary of pending verifications
+def measure(factory, state, channels, entries):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    pending = {}
+    for index in range(entries):
+        user_id = 10 ** 6 + index
+        pending[user_id] = factory(state, channels[index % GUILDS], user_id)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del pending
+    return used / entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--entries', type=int, nargs='+', default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    state, channels = make_state()
+    print(f"{'entries':>10}{'dict B/entry':>15}{'record B/entry':>17}{'saved':>8}")
+    for entries in args.entries:
+        before = measure(make_dict, state, channels, entries)
+        after = measure(make_record, state, channels, entries)
+        print(f"{entries:>10}{before:>15.0f}{after:>17.0f}{1 - after / before:>8.0%}")
+
+
+if __name__ == '__main__':
+    main()
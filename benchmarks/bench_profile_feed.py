@@ -0,0 +1,117 @@
+# Benchmark: shared profile feed
+# Several bots subscribe to one poller_service.py and watch the same names (like a user verifying
+# in servers of different bots), against the local fake Habbo server. Reports how late motto changes
+# are pushed and the Habbo requests made, compared with every bot polling its names on its own with the
+# same polling strategy
+#
+# Usage: python benchmarks/bench_profile_feed.py [--bots 1 2 4 8] [--names 200] [--strategy exponential]
+
+import argparse
+import asyncio
+import random
+import time
+
+from common import percentile
+from config import POLLING_STRATEGY, POLLING_MAX_INTERVAL, VERIFICATION_INTERVAL
+from fake_habbo import FakeHabbo
+from poller_service import PollerService
+from polling_policy import STRATEGIES, PollingState, create_policy
+from profile_source import FeedSource
+
+HOTEL = 'habbo.com'
+
+
+# Polls a bot polling on its own makes until it sees a motto set change_at seconds after the code was issued:
+# right away, then after every interval chosen by the policy while the old motto stays the same
+def independent_polls(policy, change_at):
+    state = PollingState(now=0.0)
+    elapsed = 0.0
+    polls = 1
+    while elapsed < change_at:
+        state.observe('old motto')
+        elapsed += policy.next_interval(state, now=elapsed)
+        polls += 1
+    return polls
+
+
+async def run(server, bots, names, args):
+    policy = create_policy(args.strategy)
+    service = PollerService(port=0, policy=policy, requests_per_second=10 ** 6)
+    client = service.hotels.client(HOTEL)
+    client.base_url = server.base_url
+    client.rate_limiter.rate = 0
+    await service.start()
+
+    # Names watched by every bot, and names of each bot alone
+    shared = [f"shared{index}" for index in range(int(names * args.overlap))]
+    own = names - len(shared)
+    changes = {}
+    latencies = []
+    independent = 0
+
+    # Like the bot, a name stops being watched once its code is seen
+    def listener(source):
+        def changed(hotel, name, profile):
+            change = changes.get(name)
+            if change is not None and profile.get('motto') == change[1]:
+                latencies.append(time.monotonic() - change[0])
+                source.unwatch(hotel, name)
+        return changed
+
+    sources = []
+    for bot in range(bots):
+        source = FeedSource(port=service.port)
+        await source.start(listener(source))
+        sources.append(source)
+    while not all(source.connected for source in sources):
+        await asyncio.sleep(0.01)
+
+    before = server.requests_by_path.get('/api/public/users', 0)
+    started = time.monotonic()
+    for bot, source in enumerate(sources):
+        for name in shared + [f"bot{bot}user{index}" for index in range(own)]:
+            source.watch(HOTEL, name)
+            if name not in changes:
+                delay = random.uniform(*args.motto_delay)
+                changes[name] = (started + delay, f"myt-{random.randrange(10 ** 6):06d}")
+                server.schedule_motto(name, changes[name][1], delay)
+            # The same name polled by this bot on its own
+            independent += independent_polls(policy, changes[name][0] - started)
+
+    expected = len(changes) + (bots - 1) * len(shared)
+    deadline = time.monotonic() + args.motto_delay[1] + 2 * max(POLLING_MAX_INTERVAL, VERIFICATION_INTERVAL) + 5
+    while len(latencies) < expected and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    requests = server.requests_by_path.get('/api/public/users', 0) - before
+
+    for source in sources:
+        await source.close()
+    await service.close()
+    return requests, independent, latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bots', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--names', type=int, default=200, help='Names watched by each bot')
+    parser.add_argument('--overlap', type=float, default=0.5, help='Share of the names watched by every bot')
+    parser.add_argument('--strategy', choices=STRATEGIES, default=POLLING_STRATEGY,
+                        help='Polling strategy of the service and of the bots polling on their own')
+    parser.add_argument('--motto-delay', type=float, nargs=2, default=[1.0, 10.0], metavar=('MIN', 'MAX'))
+    parser.add_argument('--latency', type=float, default=0.05, help='Fake Habbo API latency in seconds')
+    args = parser.parse_args()
+
+    server = FakeHabbo(latency=args.latency)
+    server.start_in_thread()
+    print(f"{'bots':>6}{'feed req':>10}{'own req':>10}{'saved':>8}{'push p50 ms':>13}{'push p99 ms':>13}")
+    try:
+        for bots in args.bots:
+            requests, independent, latencies = await run(server, bots, args.names, args)
+            print(f"{bots:>6}{requests:>10}{independent:>10}{1 - requests / independent:>8.0%}"
+                  f"{1000 * percentile(latencies, 50):>13.0f}{1000 * percentile(latencies, 99):>13.0f}")
+    finally:
+        server.stop_thread()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
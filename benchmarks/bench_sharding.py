@@ -0,0 +1,122 @@
+# Benchmark: multi-process sharding with a fake gateway and a fake Habbo API
+# Every worker process replays the same stream of fake "verify" events (the fake gateway), keeps only
+# the guilds of its own shards, and polls them with its own scheduler and Habbo client. The
+# coordinator collects the per-shard queue depth, poll latency and poll count reported by the workers,
+# and the poll rate is measured over the workers' own polling window
+#
+# Usage: python benchmarks/bench_sharding.py [--shards 8] [--workers 1 2 4] [--verifications 2000]
+
+import argparse
+import asyncio
+import functools
+import random
+import time
+
+import common  # noqa: F401 (adds the project folder to the import path)
+from fake_habbo import FakeHabbo
+from habbo_api import HabboClient
+from scheduler import VerificationScheduler
+from sharding import ShardStats, run_coordinator, shard_for_guild, shard_ranges
+
+# Seconds the coordinator waits past the simulated duration before stopping the workers
+DEADLINE_MARGIN = 30
+
+
+# Fake gateway: the same seeded stream of (guild_id, user_id) events for every worker
+def fake_gateway(verifications, seed=42):
+    generator = random.Random(seed)
+    for user_id in range(verifications):
+        guild_id = generator.getrandbits(62)
+        yield guild_id, user_id
+
+
+async def simulate(worker_index, shard_ids, shard_count, reports, base_url, verifications, duration,
+                   interval, report_interval):
+    # No hotel rate limit and no profile cache, so every poll is an HTTP request of the worker's own client
+    client = HabboClient('habbo.com.br', base_url=base_url, rate_limit=0)
+    await client.start()
+    stats = ShardStats()
+    shard_of = {}
+    # Finished polls of every shard
+    polls = {}
+
+    async def poll(user_id):
+        started = time.monotonic()
+        await client.get_user(f"user{user_id}", cache=False)
+        stats.record_poll(shard_of[user_id], time.monotonic() - started)
+        polls[shard_of[user_id]] = polls.get(shard_of[user_id], 0) + 1
+        return False
+
+    async def expire(user_id):
+        del shard_of[user_id]
+
+    scheduler = VerificationScheduler(poll, expire, interval=interval, requests_per_second=10000)
+    scheduler.start()
+    # Events arrive spread over the first half of the run
+    events = [(guild_id, user_id) for guild_id, user_id in fake_gateway(verifications)
+              if shard_for_guild(guild_id, shard_count) in shard_ids]
+    delay = duration / 2 / max(1, len(events))
+    window_started = time.monotonic()
+    for guild_id, user_id in events:
+        shard_of[user_id] = shard_for_guild(guild_id, shard_count)
+        scheduler.register(user_id, duration)
+        await asyncio.sleep(delay)
+
+    await asyncio.sleep(max(0.0, duration - report_interval - duration / 2))
+    queue_depths = {}
+    for shard_id in shard_of.values():
+        queue_depths[shard_id] = queue_depths.get(shard_id, 0) + 1
+    report = stats.snapshot(queue_depths)
+    window = time.monotonic() - window_started
+    for shard_id, shard_stats in report.items():
+        shard_stats['polls'] = polls.get(shard_id, 0)
+        shard_stats['window'] = window
+    reports.put((worker_index, report))
+    await scheduler.stop()
+    await client.close()
+
+
+def simulated_worker(worker_index, shard_ids, shard_count, reports, **options):
+    asyncio.run(simulate(worker_index, shard_ids, shard_count, reports, **options))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--shards', type=int, default=8)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--verifications', type=int, default=2000)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--interval', type=float, default=1.0, help='Poll interval of each verification')
+    parser.add_argument('--latency', type=float, default=0.05, help='Fake server latency in seconds')
+    args = parser.parse_args()
+
+    server = FakeHabbo(latency=args.latency)
+    base_url = server.start_in_thread()
+    print(f"{'workers':>8}{'pending':>10}{'polls/s':>10}{'poll avg ms':>13}{'poll max ms':>13}")
+    try:
+        for workers in args.workers:
+            worker = functools.partial(simulated_worker, base_url=base_url, verifications=args.verifications,
+                                       duration=args.duration, interval=args.interval, report_interval=1.0)
+            started = time.perf_counter()
+            reports = run_coordinator(worker, shard_count=args.shards, workers=workers, shard_ids=None,
+                                      report_interval=args.duration * 2, duration=args.duration + DEADLINE_MARGIN,
+                                      quiet=True)
+            elapsed = time.perf_counter() - started
+            # A worker stopped by the deadline (or that never reported) hung, its numbers aren't data
+            if elapsed >= args.duration + DEADLINE_MARGIN or len(reports) < len(shard_ranges(range(args.shards), workers)):
+                print(f"{workers:>8}  failed: {len(reports)} workers reported, run took {elapsed:.0f}s")
+                continue
+            shards = [stats for report in reports.values() for stats in report.values()]
+            pending = sum(stats['queue_depth'] for stats in shards)
+            poll_avg = sum(stats['poll_avg'] for stats in shards) / max(1, len(shards))
+            poll_max = max((stats['poll_max'] for stats in shards), default=0.0)
+            # Polls of every worker over its own polling window (process startup and shutdown excluded)
+            rate = sum(sum(stats['polls'] for stats in report.values()) / max(stats['window'] for stats in report.values())
+                       for report in reports.values() if report)
+            print(f"{workers:>8}{pending:>10}{rate:>10.0f}{1000 * poll_avg:>13.1f}{1000 * poll_max:>13.1f}")
+    finally:
+        server.stop_thread()
+
+
+if __name__ == '__main__':
+    main()
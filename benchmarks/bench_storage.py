@@ -0,0 +1,69 @@
+# Benchmark: pending verification store throughput
+# Measures batched inserts, lookups and expiry on the SQLite store
+#
+# Usage: python benchmarks/bench_storage.py [--records 1000 10000 100000]
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import common  # noqa: F401 (adds the project folder to the import path)
+from storage import SQLiteVerificationStore
+
+
+def make_record(user_id, now):
+    return {
+        'user_id': user_id,
+        'guild_id': 1000 + user_id % 50,
+        'channel_id': 2000 + user_id % 50,
+        'message_id': 3000 + user_id,
+        'habbo_user': f"User{user_id}",
+        'code': f"myt-{user_id:06d}",
+        # Half of the records are already expired
+        'expires_at': now - 1 if user_id % 2 else now + 300,
+        'hotel': 'habbo.com.br'
+    }
+
+
+async def run(records, lookups):
+    directory = tempfile.mkdtemp()
+    store = SQLiteVerificationStore(os.path.join(directory, 'bench.db'))
+    await store.start()
+    now = time.time()
+
+    started = time.perf_counter()
+    for user_id in range(records):
+        store.save(make_record(user_id, now))
+    await store.flush()
+    insert_rate = records / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for _ in range(lookups):
+        await store.get(random.randrange(records))
+    lookup_rate = lookups / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    expired = await store.expire(now)
+    expire_rate = expired / (time.perf_counter() - started)
+
+    await store.close()
+    return insert_rate, lookup_rate, expire_rate
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--records', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--lookups', type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"{'records':>10}{'inserts/s':>14}{'lookups/s':>14}{'expired/s':>14}")
+    for records in args.records:
+        insert_rate, lookup_rate, expire_rate = await run(records, args.lookups)
+        print(f"{records:>10}{insert_rate:>14.0f}{lookup_rate:>14.0f}{expire_rate:>14.0f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,52 @@
+# Shared helpers for the benchmarks
+
+import asyncio
+import os
+import sys
+import time
+
+# Allow importing the bot modules when running `python benchmarks/<script>.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Percentile of an already collected list of numbers
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+# Measures how late the event loop wakes up a task that sleeps for a fixed tick
+class LoopLagMonitor:
+    def __init__(self, tick=0.01):
+        self.tick = tick
+        self.samples = []
+        self.task = None
+        self._started = None
+
+    async def _run(self):
+        while True:
+            self._started = time.perf_counter()
+            await asyncio.sleep(self.tick)
+            self.samples.append(max(0.0, time.perf_counter() - self._started - self.tick))
+            self._started = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Count the sample in progress, the loop may have been blocked until now
+        if self._started is not None:
+            self.samples.append(max(0.0, time.perf_counter() - self._started - self.tick))
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        return {
+            'mean_ms': 1000 * sum(self.samples) / max(1, len(self.samples)),
+            'p99_ms': 1000 * percentile(self.samples, 99),
+            'max_ms': 1000 * max(self.samples, default=0.0)
+        }
@@ -0,0 +1,159 @@
+# In-process fake of the Discord objects used by the bot commands
+# Contexts, guilds, members, channels and messages count every REST call they would make and wait a
+# configurable latency instead, so the real commands run without a gateway or network connection
+
+import asyncio
+import itertools
+
+from config import VERIFIED_ROLE
+
+_ids = itertools.count(1)
+
+
+# Counts the calls that would reach the Discord REST API and simulates their latency
+class FakeREST:
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.calls = {}
+
+    async def call(self, kind):
+        self.calls[kind] = self.calls.get(kind, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+
+class FakePermissions:
+    manage_roles = True
+    manage_guild = True
+
+
+class FakeRole:
+    def __init__(self, name, position, role_id=None):
+        self.id = role_id or next(_ids)
+        self.name = name
+        self.position = position
+
+    def __repr__(self):
+        return f"<FakeRole {self.name}>"
+
+
+class FakeGuild:
+    def __init__(self, rest, guild_id, shard_id=0, with_role=True):
+        self.rest = rest
+        self.id = guild_id
+        self.shard_id = shard_id
+        self.default_role = FakeRole('@everyone', 0, guild_id)
+        self.roles = [self.default_role]
+        self.channels = {}
+        self.members = {}
+        if with_role:
+            self.roles.append(FakeRole(VERIFIED_ROLE, 1))
+        self.me = FakeMember(self, next(_ids), 'bot')
+        self.me.top_role = FakeRole('bot', 10)
+
+    def get_role(self, role_id):
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    def get_channel_or_thread(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+    async def fetch_member(self, user_id):
+        await self.rest.call('fetch_member')
+        return self.members[user_id]
+
+    async def create_role(self, name, colour=None):
+        await self.rest.call('create_role')
+        role = FakeRole(name, 1)
+        self.roles.append(role)
+        return role
+
+
+class FakeMember:
+    def __init__(self, guild, user_id, name):
+        self.guild = guild
+        self.id = user_id
+        self.name = name
+        self.nick = None
+        self.roles = [guild.default_role]
+        self.top_role = guild.default_role
+        self.guild_permissions = FakePermissions()
+        guild.members[user_id] = self
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+    @property
+    def display_name(self):
+        return self.nick or self.name
+
+    def get_role(self, role_id):
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    async def edit(self, roles=None, nick=None):
+        await self.guild.rest.call('member_edit')
+        if roles is not None:
+            self.roles = [self.guild.default_role] + list(roles)
+        if nick is not None:
+            self.nick = nick
+
+    # One request per role, like discord.py's atomic role changes
+    async def add_roles(self, *roles):
+        for role in roles:
+            await self.guild.rest.call('role_add')
+            if role not in self.roles:
+                self.roles.append(role)
+
+    async def remove_roles(self, *roles):
+        for role in roles:
+            await self.guild.rest.call('role_remove')
+            if role in self.roles:
+                self.roles.remove(role)
+
+
+class FakeMessage:
+    def __init__(self, channel, content):
+        self.channel = channel
+        self.id = next(_ids)
+        self.content = content
+
+    async def edit(self, content=None):
+        await self.channel.rest.call('message_edit')
+        self.content = content
+
+    async def delete(self):
+        await self.channel.rest.call('message_delete')
+
+
+class FakeChannel:
+    def __init__(self, rest, channel_id=None, guild=None):
+        self.rest = rest
+        self.id = channel_id or next(_ids)
+        if guild is not None:
+            guild.channels[self.id] = self
+
+    async def send(self, content=None, file=None):
+        await self.rest.call('message_send_file' if file is not None else 'message_send')
+        return FakeMessage(self, content)
+
+    def get_partial_message(self, message_id):
+        message = FakeMessage(self, None)
+        message.id = message_id
+        return message
+
+
+# Command context of one member in one channel
+class FakeContext:
+    def __init__(self, guild, channel, author):
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+
+    async def send(self, content=None, file=None):
+        return await self.channel.send(content, file=file)
+
+    async def invoke(self, command, **kwargs):
+        return await command.callback(self, **kwargs)
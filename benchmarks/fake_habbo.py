@@ -0,0 +1,108 @@
+# Local fake Habbo HTTP server used by the benchmarks
+# Serves /api/public/users and /habbo-imaging/avatarimage with configurable latency and error rate.
+# Mottos of single users can be scheduled to change after a delay, like a user setting their code
+
+import asyncio
+import random
+import struct
+import time
+import zlib
+
+from aiohttp import web
+
+
+# Build a simple RGBA PNG so the avatar endpoint works without Pillow
+def make_png(width=64, height=110, color=(200, 120, 60, 255)):
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    row = b'\x00' + bytes(color) * width
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(row * height)) + chunk(b'IEND', b'')
+
+
+class FakeHabbo:
+    def __init__(self, latency=0.05, error_rate=0.0, motto='fake motto'):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.motto = motto
+        self.avatar = make_png()
+        self.requests = 0
+        self.requests_by_path = {}
+        # name (lowercase) -> (monotonic time of the change, new motto)
+        self.motto_changes = {}
+        self.runner = None
+        self.base_url = None
+
+    # Make the motto of a user change after delay seconds (called from any thread)
+    def schedule_motto(self, name, motto, delay=0.0):
+        self.motto_changes[name.lower()] = (time.monotonic() + delay, motto)
+
+    def motto_of(self, name):
+        change = self.motto_changes.get(name.lower())
+        if change is not None and time.monotonic() >= change[0]:
+            return change[1]
+        return self.motto
+
+    async def _delay(self, request):
+        self.requests += 1
+        self.requests_by_path[request.path] = self.requests_by_path.get(request.path, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return random.random() < self.error_rate
+
+    async def users(self, request):
+        if await self._delay(request):
+            return web.json_response({'error': 'unavailable'}, status=503)
+        name = request.query.get('name', '')
+        if name.lower().startswith('notfound'):
+            return web.json_response({'error': 'not-found'}, status=404)
+        return web.json_response({'name': name, 'motto': self.motto_of(name), 'profileVisible': True})
+
+    async def avatar_image(self, request):
+        if await self._delay(request):
+            return web.Response(status=503)
+        # Support conditional requests like habbo-imaging does
+        etag = '"avatar-v1"'
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.Response(body=self.avatar, content_type='image/png', headers={'ETag': etag})
+
+    async def start(self, host='127.0.0.1', port=0):
+        app = web.Application()
+        app.router.add_get('/api/public/users', self.users)
+        app.router.add_get('/habbo-imaging/avatarimage', self.avatar_image)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    # Run the server on its own event loop in a background thread, so a blocked
+    # benchmark loop can't stall the server it is talking to
+    def start_in_thread(self):
+        import threading
+        ready = threading.Event()
+        self.loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(self.start())
+            ready.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        ready.wait()
+        return self.base_url
+
+    def stop_thread(self):
+        asyncio.run_coroutine_threadsafe(self.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
@@ -0,0 +1,103 @@
+# Simulation: polling strategies
+# Replays when users change their motto and compares Habbo API calls per successful verification
+# and time-to-verify for every polling strategy (no network involved)
+#
+# Usage: python benchmarks/simulate_polling.py [--data timings.csv] [--users 10000]
+#
+# The data file has one verification per line: "change_at,first_edit_at" in seconds after the code
+# was issued. change_at is empty when the user never set the code, first_edit_at is empty when the
+# motto went straight to the code. Without a file a synthetic distribution is generated
+
+import argparse
+import csv
+import random
+
+import common
+from config import EXPIRATION_TIME
+from polling_policy import STRATEGIES, PollingState
+
+
+# Synthetic timings: most users set the code within a couple of minutes, some edit the motto in
+# steps first and some never finish
+def synthetic_timings(users, seed=1):
+    rng = random.Random(seed)
+    timings = []
+    for _ in range(users):
+        if rng.random() < 0.2:
+            timings.append((None, None))
+            continue
+        change_at = rng.lognormvariate(4.2, 0.7)  # Median around 65 seconds
+        first_edit_at = change_at - rng.uniform(3, 20) if rng.random() < 0.4 else None
+        timings.append((change_at, first_edit_at if first_edit_at and first_edit_at > 0 else None))
+    return timings
+
+
+def load_timings(path):
+    timings = []
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith('#'):
+                continue
+            change_at = float(row[0]) if row[0].strip() else None
+            first_edit_at = float(row[1]) if len(row) > 1 and row[1].strip() else None
+            timings.append((change_at, first_edit_at))
+    return timings
+
+
+def motto_at(t, change_at, first_edit_at):
+    if change_at is not None and t >= change_at:
+        return 'code'
+    if first_edit_at is not None and t >= first_edit_at:
+        return 'editing'
+    return 'old motto'
+
+
+# Poll one verification the way the scheduler does: right away, then after each interval, never past the expiry
+def simulate(strategy, change_at, first_edit_at, expiration=EXPIRATION_TIME):
+    state = PollingState(now=0.0)
+    t = 0.0
+    calls = 0
+    while True:
+        calls += 1
+        motto = motto_at(t, change_at, first_edit_at)
+        if motto == 'code':
+            return calls, t
+        state.observe(motto)
+        t = min(t + strategy.next_interval(state, now=t), expiration)
+        if t >= expiration:
+            return calls, None
+
+
+def run(timings):
+    print(f"{len(timings)} verifications, {sum(1 for c, _ in timings if c is not None and c < EXPIRATION_TIME)} set "
+          f"the code before expiring")
+    print(f"{'strategy':>18}{'API calls':>12}{'calls/success':>15}{'success':>10}{'p50 verify s':>14}"
+          f"{'p90 verify s':>14}{'p50 delay s':>13}")
+    for name, strategy_class in STRATEGIES.items():
+        strategy = strategy_class()
+        calls = 0
+        verify_times = []
+        delays = []
+        for change_at, first_edit_at in timings:
+            used, verified_at = simulate(strategy, change_at, first_edit_at)
+            calls += used
+            if verified_at is not None:
+                verify_times.append(verified_at)
+                delays.append(verified_at - change_at)
+        successes = len(verify_times)
+        print(f"{name:>18}{calls:>12}{calls / max(1, successes):>15.1f}{successes:>10}"
+              f"{common.percentile(verify_times, 50):>14.1f}{common.percentile(verify_times, 90):>14.1f}"
+              f"{common.percentile(delays, 50):>13.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', help="CSV file with recorded motto change timings")
+    parser.add_argument('--users', type=int, default=10000, help="Synthetic verifications when no file is given")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    run(load_timings(args.data) if args.data else synthetic_timings(args.users, args.seed))
+
+
+if __name__ == '__main__':
+    main()
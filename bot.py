@@ -1,60 +1,208 @@
+# Startup is measured from here (see --profile-startup)
+import time
+IMPORT_STARTED = time.perf_counter()
+
+import argparse
 import discord
 import asyncio
 import random
 import string
-import requests
-import json
 import os
-from datetime import datetime, timedelta
 from discord.ext import commands
-from PIL import Image, ImageDraw, ImageFont
 from io import BytesIO
 
 # Import configuration
 from dotenv import load_dotenv
-from config import *
+from config import (PREFIX, VERIFY_COMMAND, CODE_PREFIX, EXPIRATION_TIME, VERIFIED_ROLE,
+                    CHANGE_NICKNAME, RENDER_PRELOAD, METRICS_ENABLED, METRICS_PORT, SHARD_COUNT, WORKERS_PER_HOST,
+                    SHARD_REPORT_INTERVAL, PROFILE_FEED_FALLBACK_INTERVAL)
+from habbo_api import HotelClients
+from avatar_cache import AvatarCache
+from image_renderer import ImageRenderer
+from scheduler import VerificationScheduler
+from polling_policy import PollingState, create_policy
+from profile_source import create_source
+from pending import PendingVerification
+from identity_index import IdentityIndex
+from storage import open_store
+from sharding import ShardStats, run_coordinator, shard_for_guild
+from discord_actions import DiscordActionQueue
+from audit import MemberAudit
+from templates import TemplateRegistry
+from metrics import (MetricsServer, tracer, ACTIVE_VERIFICATIONS, DISCORD_REST_LATENCY, IMAGE_RENDER_TIME,
+                     VERIFICATION_DURATION, VERIFICATION_OUTCOMES)
+from config_watch import config_watcher
+from startup import StartupProfiler
+
+# Time spent in every startup phase, written as a report with --profile-startup
+profiler = StartupProfiler(IMPORT_STARTED)
+profiler.mark('imports')
+
+# Report file of --profile-startup (the bot stops once it is written)
+profile_path = None
 
 # Load environment variables
 load_dotenv()
 TOKEN = os.environ.get('DISCORD_TOKEN')  # Get token from environment variable
 
-# Load messages from JSON file
-def load_messages():
-    try:
-        with open('messages.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading messages: {e}")
-        return {}
-
-# Global messages dictionary
-MESSAGES = load_messages()
-
 # Intents configuration
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
-# Bot initialization
-bot = commands.Bot(command_prefix=PREFIX, intents=intents)
+# Components of the bot, created by create_app
+# Message templates, checked at startup so a broken messages.json stops the bot right away
+templates = None
+
+# Habbo API clients, one per hotel (the default hotel's connection pool is created in setup_hook)
+habbo_hotels = None
+
+# Hotel chosen by each guild with the hotel command, loaded from the store in setup_hook
+guild_hotels = {}
+
+# Avatar images cached in memory and on disk
+avatar_cache = None
+
+# Storage keeping pending verifications across restarts
+store = None
+
+# Habbo account each member was last verified as, in any guild
+identities = None
+
+# Per-guild queue for role and nickname changes
+discord_actions = None
+
+# Local /metrics and /traces endpoint
+metrics_server = None
+
+# Source of pushed profile changes (the polling source pushes nothing, the scheduler polls instead)
+profile_source = None
+
+# Verification image renderer (Pillow and the worker pool are loaded on the first image, or in setup_hook
+# with RENDER_PRELOAD)
+image_renderer = None
+
+# The bot itself
+bot = None
+
+class VerifyBot(commands.AutoShardedBot):
+    # Set by run_shard_worker when running as a worker process of the sharding coordinator
+    worker_index = None
+    shard_reports = None
+    
+    async def setup_hook(self):
+        profiler.mark('login')
+        templates.start()
+        config_watcher.start()
+        with profiler.phase('storage'):
+            await store.start()
+            guild_hotels.update(await store.load_guild_hotels())
+        with profiler.phase('habbo_clients'):
+            await habbo_hotels.start()
+            await profile_source.start(profile_changed, profile_feed_lost)
+        instrument_http(self.http)
+        if METRICS_ENABLED:
+            with profiler.phase('metrics_server'):
+                # Each sharding worker gets its own port
+                metrics_server.port = METRICS_PORT + (self.worker_index or 0)
+                await metrics_server.start()
+        if RENDER_PRELOAD:
+            with profiler.phase('render_preload'):
+                image_renderer.start(preload=True)
+        scheduler.start()
+        if self.shard_reports is not None:
+            self.loop.create_task(report_shard_stats())
+
+    async def close(self):
+        # Audits resume from their last checkpoint on the next run
+        for task in list(running_audits.values()):
+            task.cancel()
+        await scheduler.stop()
+        print(f"Scheduler: {scheduler.stats()}")
+        await profile_source.close()
+        templates.stop()
+        await config_watcher.stop()
+        await metrics_server.close()
+        await store.close()
+        await habbo_hotels.close()
+        # Report profile, avatar, render and identity cache usage to help sizing them
+        print(f"Profile cache: {habbo_hotels.profile_cache.stats()}")
+        print(f"Avatar cache: {avatar_cache.stats()}")
+        print(f"Render cache: {image_renderer.stats()}")
+        print(f"Identity index: {identities.stats()}")
+        image_renderer.close()
+        await super().close()
 
 # Dictionary to store active verifications
-# Structure: {user_id: {'habbo_user': str, 'code': str, 'expires_at': datetime, 'task': asyncio.Task}}
+# Structure: {user_id: PendingVerification}, holding Discord ids that are looked up again when a message is sent
+# Polling is done by the scheduler, which tracks the same user ids, and every entry is also saved in the store
 active_verifications = {}
 
-@bot.event
+# Pending verifications by the name they watch: {(hotel, lowercase name): {user_id}}
+watchers = {}
+
+# Whether saved verifications were already restored (on_ready runs again after reconnects)
+verifications_restored = False
+
+# Background tasks started by the bot (kept so they aren't garbage collected while running)
+background_tasks = set()
+
+ACTIVE_VERIFICATIONS.set_function(lambda: len(active_verifications))
+
 async def on_ready():
     # Check if bot.user exists before accessing name attribute
     if bot.user:
-        print(MESSAGES.get('bot', {}).get('online', '{bot_name} is online!').format(bot_name=bot.user.name))
+        print(templates.render('bot', 'online', bot_name=bot.user.name))
     else:
         print('Bot is online but user object is not available')
     # Check if bot.user exists before accessing id attribute
     if bot.user:
-        print(MESSAGES.get('bot', {}).get('id', 'ID: {bot_id}').format(bot_id=bot.user.id))
+        print(templates.render('bot', 'id', bot_id=bot.user.id))
     else:
         print('Bot ID not available')
     print('------')
+    
+    global verifications_restored
+    if not verifications_restored:
+        verifications_restored = True
+        profiler.mark('gateway_connect')
+        with profiler.phase('restore'):
+            await restore_verifications()
+        if profile_path:
+            profiler.write(profile_path)
+            await bot.close()
+
+# Forget cached roles when the roles of a guild change
+async def on_guild_role_create(role):
+    discord_actions.invalidate_roles(role.guild.id)
+
+async def on_guild_role_update(before, after):
+    discord_actions.invalidate_roles(after.guild.id)
+
+async def on_guild_role_delete(role):
+    discord_actions.invalidate_roles(role.guild.id)
+
+# Function to measure the latency of every Discord REST request (send, edit, delete, role changes...)
+def instrument_http(http):
+    request = http.request
+    
+    async def timed_request(route, **kwargs):
+        with DISCORD_REST_LATENCY.labels(route.method, route.path).time():
+            return await request(route, **kwargs)
+    
+    http.request = timed_request
+
+# Function to count how a verification ended and close its trace
+def record_outcome(entry, outcome):
+    VERIFICATION_OUTCOMES.labels(outcome).inc()
+    entry.trace.finish(outcome=outcome)
+
+# Function to run a coroutine in the background
+def spawn_task(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
 
 # Function to generate random code
 def generate_code():
@@ -62,281 +210,376 @@ def generate_code():
     code = ''.join(random.choice(characters) for _ in range(6))
     return f"{CODE_PREFIX}{code}"
 
+# Function to start tracking a verification (dictionary, scheduler and store)
+def add_verification(entry):
+    entry.trace = tracer.start('verification', user_id=entry.user_id, habbo_user=entry.habbo_user)
+    active_verifications[entry.user_id] = entry
+    # With a connected profile feed the first profile is pushed, the bot's own polls are only a safety net
+    scheduler.register(entry.user_id, entry.expires_in, PROFILE_FEED_FALLBACK_INTERVAL if profile_source.connected else 0)
+    watchers.setdefault((entry.hotel, entry.habbo_user.lower()), set()).add(entry.user_id)
+    profile_source.watch(entry.hotel, entry.habbo_user)
+    store.save(entry.to_record())
+
+# Function to stop tracking a verification (only if it is still the given entry)
+def remove_verification(user_id, entry=None):
+    if user_id in active_verifications and (entry is None or active_verifications[user_id] is entry):
+        entry = active_verifications.pop(user_id)
+        scheduler.deregister(user_id)
+        key = (entry.hotel, entry.habbo_user.lower())
+        watchers[key].discard(user_id)
+        if not watchers[key]:
+            del watchers[key]
+        profile_source.unwatch(entry.hotel, entry.habbo_user)
+        store.delete(user_id)
+
+# Function to resume verifications saved before the bot restarted
+async def restore_verifications():
+    restored = 0
+    for record in await store.load_pending(time.time()):
+        user_id = record['user_id']
+        guild = bot.get_guild(record['guild_id'])
+        if guild is None:
+            # Guild unavailable or handled by another process, keep the record
+            continue
+        if guild.get_channel_or_thread(record['channel_id']) is None:
+            store.delete(user_id)
+            continue
+        
+        # The member is looked up when the verification completes
+        add_verification(PendingVerification.from_record(record, guild_hotel(guild)))
+        restored += 1
+    
+    if restored:
+        print(f"Restored {restored} pending verifications")
+
+# Function to get the shard of a guild from its id, without looking the guild up
+def shard_of(guild_id):
+    return shard_for_guild(guild_id, bot.shard_count or 1)
+
+# Function to get the hotel a guild verifies against
+def guild_hotel(guild):
+    if guild is None:
+        return habbo_hotels.default
+    return guild_hotels.get(guild.id, habbo_hotels.default)
+
+# Function to compare the profile of a Habbo user with the verification code
+def check_profile(habbo_user, code, data):
+    # Check if user exists or has open profile
+    if not data or 'error' in data:
+        return "user_not_found"
+    
+    # Get exact username from API
+    exact_name = data.get('name') or habbo_user
+    
+    motto = data.get('motto')
+    return {'verified': motto == code, 'exact_name': exact_name, 'motto': motto}
+
 # Function to verify Habbo user
-async def verify_user(user_id, habbo_user, code):
+async def verify_user(user_id, habbo_user, code, hotel=None):
     try:
-        url = f"https://www.{SERVER_OPTION}/api/public/users?name={habbo_user}"
-        response = requests.get(url)
-        data = response.json()
-        
-        # Check if user exists or has open profile
-        if 'error' in data or not data:
-            return "user_not_found"
-        
-        # Get exact username from API
-        exact_name = data.get('name', habbo_user)
-        
-        if 'motto' in data and data['motto'] == code:
-            return {'verified': True, 'exact_name': exact_name}
-        return {'verified': False, 'exact_name': exact_name}
+        data = await habbo_hotels.client(hotel).get_user(habbo_user)
+        return check_profile(habbo_user, code, data)
     except Exception as e:
         print(f"Error verifying user: {e}")
         return {'verified': False, 'exact_name': habbo_user}
 
+# Function to check that the account of a verified identity still exists under the same name (one cached lookup)
+# Returns its exact name, or None when it is gone (the identity is forgotten) or couldn't be checked
+async def confirm_identity(identity):
+    try:
+        data = await habbo_hotels.client(identity['hotel']).get_user(identity['habbo_name'])
+    except Exception as e:
+        print(f"Error checking the verified identity of {identity['user_id']}: {e}")
+        return None
+    # Only a 404 comes back as an error
+    if not data or 'error' in data:
+        exact_name = None
+    else:
+        exact_name = data.get('name') or identity['habbo_name']
+    if exact_name is None or exact_name.lower() != identity['habbo_name'].lower():
+        await identities.forget([identity['user_id']])
+        return None
+    return exact_name
+
 # Function to create custom image
-async def create_verification_image(habbo_user):
+async def create_verification_image(habbo_user, hotel=None):
     try:
-        # Download Habbo avatar
-        avatar_url = f"http://www.{SERVER_OPTION}/habbo-imaging/avatarimage?&user={habbo_user}&action=std&direction=2&head_direction=3&img_format=png&gesture=sml&headonly=0&size=l"
-        response = requests.get(avatar_url)
-        avatar_img = Image.open(BytesIO(response.content))
-        
-        # Create base image
-        img_width, img_height = 500, 200
-        
-        # Check if custom background image exists
-        if BACKGROUND_IMAGE and os.path.exists(BACKGROUND_IMAGE):
-            try:
-                # Load background image
-                background = Image.open(BACKGROUND_IMAGE).convert('RGBA')
-                # Resize to correct size
-                background = background.resize((img_width, img_height))
-                img = background
-            except Exception as e:
-                print(f"Error loading background image: {e}")
-                # Fallback to solid color
-                img = Image.new('RGBA', (img_width, img_height), BACKGROUND_COLOR)
-        else:
-            # Use solid color as background
-            img = Image.new('RGBA', (img_width, img_height), BACKGROUND_COLOR)
-        
-        draw = ImageDraw.Draw(img)
-        
-        img.paste(avatar_img, (20, 0), avatar_img)
-        
-        # Load custom font or use fallback
-        try:
-            if CUSTOM_FONT and os.path.exists(CUSTOM_FONT):
-                font = ImageFont.truetype(CUSTOM_FONT, FONT_SIZE)
-            else:
-                # Fallback to system fonts
-                try:
-                    font = ImageFont.truetype("arialbd.ttf", FONT_SIZE)  # Arial Bold
-                except IOError:
-                    try:
-                        font = ImageFont.truetype("arial.ttf", FONT_SIZE)  # Arial
-                    except IOError:
-                        font = ImageFont.load_default()
-        except Exception as e:
-            print(f"Error loading font: {e}")
-            font = ImageFont.load_default()
-        
-        # Add custom text
-        draw.text((200, 60), f"{habbo_user},", font=font, fill=MAIN_TEXT_COLOR)
-        draw.text((200, 90), VERIFICATION_TEXT, font=font, fill=SECONDARY_TEXT_COLOR)
+        # Get Habbo avatar (downloaded or from the cache)
+        avatar_bytes = await avatar_cache.get(habbo_user, hotel)
         
-        # Save to buffer
-        buffer = BytesIO()
-        img.save(buffer, 'PNG')
-        buffer.seek(0)
+        # Composite and encode in the render pool, or reuse the image already rendered for this user
+        with IMAGE_RENDER_TIME.time():
+            image_bytes = await image_renderer.render(avatar_bytes, habbo_user)
         
-        return buffer
+        # BytesIO shares the (possibly cached) bytes instead of copying them
+        return BytesIO(image_bytes)
     except Exception as e:
         print(f"Error creating image: {e}")
         return None
 
-# Function for continuous verification process
-async def verification_process(ctx, user_id, habbo_user, code):
-    expires_at = datetime.now() + timedelta(seconds=EXPIRATION_TIME)
+# Function to finish a successful verification: assign role, change nickname and send the result
+# Runs in the background so Discord requests don't hold up the scheduler's poll rounds
+# reused is True when the member was verified without a code, from an identity verified in another guild
+async def complete_verification(entry, exact_name, reused=False):
+    guild = entry.guild(bot)
+    channel = entry.channel(bot)
+    member = await entry.member(bot)
+    if channel is None or member is None:
+        # The channel was deleted or the member left while the code was pending
+        record_outcome(entry, 'error')
+        return
     
-    # Store instruction message to edit it later
-    status_message = active_verifications[user_id].get('message')
+    # Instruction message to edit it later
+    status_message = entry.message(channel)
     
-    while datetime.now() < expires_at:
-        if user_id not in active_verifications:
-            # Verification was cancelled
-            return
-            
-        result = await verify_user(user_id, habbo_user, code)
+    try:
+        # Get role (cached per guild, created if it doesn't exist)
+        role = await discord_actions.get_role(guild, VERIFIED_ROLE)
         
-        if result == "user_not_found":
-            # Get message from messages.json or use default
-            user_not_found_msg = MESSAGES.get('verification_process', {}).get('user_not_found', "{mention} Could not find user **{habbo_user}** on Habbo. Please check if the name is correct or if the profile is open for public viewing.")
-            formatted_msg = user_not_found_msg.format(
-                mention=ctx.author.mention,
-                habbo_user=habbo_user
+        # Check bot permissions
+        bot_member = guild.me
+        if not bot_member.guild_permissions.manage_roles:
+            formatted_msg = templates.render('verification_process', 'bot_no_permission', guild,
+                mention=member.mention
             )
             
             # Enviar como nova mensagem em vez de editar a existente
-            await ctx.send(formatted_msg)
-            
-            if user_id in active_verifications:
-                del active_verifications[user_id]
+            await channel.send(formatted_msg)
+            record_outcome(entry, 'forbidden')
             return
+
+        # Check role hierarchy
+        if role.position >= bot_member.top_role.position:
+            formatted_msg = templates.render('verification_process', 'role_hierarchy_error', guild,
+                mention=member.mention,
+                role_name=VERIFIED_ROLE
+            )
             
-        if result['verified']:
-            # Use exact name returned by API
-            exact_name = result['exact_name']
-            # User verified successfully
-            try:
-                # Get role
-                guild = ctx.guild
-                role = discord.utils.get(guild.roles, name=VERIFIED_ROLE)
-                
-                # Create role if it doesn't exist
-                if role is None:
-                    role = await guild.create_role(name=VERIFIED_ROLE, colour=discord.Colour.green())
-                
-                # Check bot permissions
-                bot_member = ctx.guild.me
-                if not bot_member.guild_permissions.manage_roles:
-                    # Get message from messages.json or use default
-                    no_permission_msg = MESSAGES.get('verification_process', {}).get('bot_no_permission', "{mention} Error: Bot doesn't have permission to manage roles. Please ask an administrator to give the 'Manage Roles' permission to the bot.")
-                    formatted_msg = no_permission_msg.format(
-                        mention=ctx.author.mention
-                    )
-                    
-                    # Enviar como nova mensagem em vez de editar a existente
-                    await ctx.send(formatted_msg)
-                    return
-
-                # Check role hierarchy
-                if role.position >= bot_member.top_role.position:
-                    # Get message from messages.json or use default
-                    role_hierarchy_msg = MESSAGES.get('verification_process', {}).get('role_hierarchy_error', "{mention} Error: The '{role_name}' role is above the bot's highest role. Please ask an administrator to move the bot's role above the '{role_name}' role.")
-                    formatted_msg = role_hierarchy_msg.format(
-                        mention=ctx.author.mention,
-                        role_name=VERIFIED_ROLE
-                    )
-                    
-                    # Enviar como nova mensagem em vez de editar a existente
-                    await ctx.send(formatted_msg)
-                    return
-
-                # Assign role
-                member = ctx.author
+            # Enviar como nova mensagem em vez de editar a existente
+            await channel.send(formatted_msg)
+            record_outcome(entry, 'forbidden')
+            return
+
+        # Assign role and change user's nickname (if setting is enabled) in a single member edit
+        nick = exact_name if CHANGE_NICKNAME else None
+        try:
+            with entry.trace.span('member_edit'):
+                await discord_actions.edit_member(member, role=role, nick=nick)
+        except discord.Forbidden:
+            # The nickname may be the problem (e.g. server owner), so try the role alone
+            role_assigned = False
+            if nick is not None:
                 try:
-                    await member.add_roles(role)
+                    await discord_actions.edit_member(member, role=role)
+                    role_assigned = True
                 except discord.Forbidden:
-                    # Get message from messages.json or use default
-                    role_assign_error_msg = MESSAGES.get('verification_process', {}).get('role_assign_error', "{mention} Error: Could not assign role. Please check if the bot has the necessary permissions and if the bot's role is above the '{role_name}' role.")
-                    formatted_msg = role_assign_error_msg.format(
-                        mention=ctx.author.mention,
-                        role_name=VERIFIED_ROLE
-                    )
-                    
-                    # Enviar como nova mensagem em vez de editar a existente
-                    await ctx.send(formatted_msg)
-                    return
-                
-                # Create custom image
-                image = await create_verification_image(exact_name)
-                
-                # Change user's nickname if setting is enabled
-                if CHANGE_NICKNAME:
-                    # Change user's nickname to verified Habbo name
-                    await member.edit(nick=exact_name)
-                    
-                    # Get message from messages.json or use default
-                    success_nickname_msg = MESSAGES.get('verification_process', {}).get('success_with_nickname', "{mention} Verification completed successfully! Your nickname has been changed to **{habbo_user}**.") 
-                    formatted_msg = success_nickname_msg.format(
-                        mention=ctx.author.mention,
-                        habbo_user=exact_name
-                    )
-                    
-                    # Inform that nickname was changed
-                    if status_message:
-                        if image:
-                            # To send a file with the edit, we need to delete the old message and send a new one
-                            await status_message.delete()
-                            status_message = await ctx.send(formatted_msg, file=discord.File(fp=image, filename="verified.png"))
-                        else:
-                            await status_message.edit(content=formatted_msg) 
-                    else:
-                        if image:
-                            status_message = await ctx.send(formatted_msg, file=discord.File(fp=image, filename="verified.png"))
-                        else:
-                            status_message = await ctx.send(formatted_msg)
+                    pass
+            if role_assigned:
+                raise
+            
+            formatted_msg = templates.render('verification_process', 'role_assign_error', guild,
+                mention=member.mention,
+                role_name=VERIFIED_ROLE
+            )
+            
+            # Enviar como nova mensagem em vez de editar a existente
+            await channel.send(formatted_msg)
+            record_outcome(entry, 'forbidden')
+            return
+        
+        if not reused:
+            # Role granted, measure time since the code was issued and remember the identity for other guilds
+            VERIFICATION_DURATION.observe(EXPIRATION_TIME - entry.expires_in)
+            await identities.record(member.id, entry.hotel, exact_name)
+        
+        # Create custom image
+        with entry.trace.span('image'):
+            image = await create_verification_image(exact_name, entry.hotel)
+        
+        # Nickname was changed together with the role if setting is enabled
+        if CHANGE_NICKNAME:
+            formatted_msg = templates.render('verification_process', 'success_with_nickname', guild,
+                mention=member.mention,
+                habbo_user=exact_name
+            )
+            
+            # Inform that nickname was changed
+            if status_message:
+                if image:
+                    # To send a file with the edit, we need to delete the old message and send a new one
+                    await status_message.delete()
+                    status_message = await channel.send(formatted_msg, file=discord.File(fp=image, filename="verified.png"))
+                else:
+                    await status_message.edit(content=formatted_msg) 
+            else:
+                if image:
+                    status_message = await channel.send(formatted_msg, file=discord.File(fp=image, filename="verified.png"))
+                else:
+                    status_message = await channel.send(formatted_msg)
+        else:
+            # If not changing nickname, send success message with image
+            formatted_msg = templates.render('verification_process', 'success', guild,
+                mention=member.mention
+            )
+            
+            if status_message:
+                if image:
+                    # To send a file with the edit, we need to delete the old message and send a new one
+                    # since Discord doesn't allow editing messages to add files
+                    await status_message.delete()
+                    status_message = await channel.send(formatted_msg, file=discord.File(fp=image, filename="verified.png"))
+                else:
+                    await status_message.edit(content=formatted_msg)
+            else:
+                if image:
+                    status_message = await channel.send(formatted_msg, file=discord.File(fp=image, filename="verified.png"))
                 else:
-                    # If not changing nickname, send success message with image
-                    # Get message from messages.json or use default
-                    success_msg = MESSAGES.get('verification_process', {}).get('success', "{mention} Verification completed successfully!")
-                    formatted_msg = success_msg.format(
-                        mention=ctx.author.mention
-                    )
-                    
-                    if status_message:
-                        if image:
-                            # To send a file with the edit, we need to delete the old message and send a new one
-                            # since Discord doesn't allow editing messages to add files
-                            await status_message.delete()
-                            status_message = await ctx.send(formatted_msg, file=discord.File(fp=image, filename="verified.png"))
-                        else:
-                            await status_message.edit(content=formatted_msg)
-                    else:
-                        if image:
-                            status_message = await ctx.send(formatted_msg, file=discord.File(fp=image, filename="verified.png"))
-                        else:
-                            status_message = await ctx.send(formatted_msg)
-                
-                # Remove from active verifications dictionary
-                if user_id in active_verifications:
-                    del active_verifications[user_id]
-                    
-                return
-            except Exception as e:
-                # Get message from messages.json or use default
-                error_msg = MESSAGES.get('verification_process', {}).get('error', "{mention} Error assigning role: {error}")
-                formatted_msg = error_msg.format(
-                    mention=ctx.author.mention,
-                    error=str(e)
-                )
-                
-                # Enviar como nova mensagem em vez de editar a existente
-                await ctx.send(formatted_msg)
-                
-                if user_id in active_verifications:
-                    del active_verifications[user_id]
-                return
+                    status_message = await channel.send(formatted_msg)
         
-        # Wait interval before next verification
-        await asyncio.sleep(VERIFICATION_INTERVAL)
+        record_outcome(entry, 'reused' if reused else 'verified')
+    except Exception as e:
+        formatted_msg = templates.render('verification_process', 'error', guild,
+            mention=member.mention,
+            error=str(e)
+        )
+        
+        # Enviar como nova mensagem em vez de editar a existente
+        await channel.send(formatted_msg)
+        record_outcome(entry, 'error')
+
+# Function to check a pending verification once (called by the scheduler)
+# Returns True when the verification is finished and should stop being polled
+async def verification_process(user_id):
+    entry = active_verifications.get(user_id)
+    if entry is None:
+        # Verification was cancelled
+        return True
     
-    # Time expired
-    if user_id in active_verifications:
-        # Get message from messages.json or use default
-        expired_msg = MESSAGES.get('verification_process', {}).get('expired', "{mention} Verification time expired. Use `{prefix}{command} {habbo_user}` to try again.")
-        formatted_msg = expired_msg.format(
-            mention=ctx.author.mention,
-            prefix=PREFIX,
-            command=VERIFY_COMMAND,
-            habbo_user=result['exact_name']
+    habbo_user = entry.habbo_user
+    
+    started = time.monotonic()
+    with entry.trace.span('habbo_api'):
+        result = await verify_user(user_id, habbo_user, entry.code, entry.hotel)
+    shard_stats.record_poll(shard_of(entry.guild_id), time.monotonic() - started)
+    
+    return await handle_result(user_id, entry, result)
+
+# Function to act on the result of checking a verification, polled or pushed by the profile source
+# Returns True when the verification is finished
+async def handle_result(user_id, entry, result):
+    if active_verifications.get(user_id) is not entry:
+        # Verification was cancelled, restarted or already finished while the API was being checked
+        return True
+    
+    habbo_user = entry.habbo_user
+    
+    if result == "user_not_found":
+        remove_verification(user_id, entry)
+        record_outcome(entry, 'user_not_found')
+        
+        formatted_msg = templates.render('verification_process', 'user_not_found', entry.guild(bot),
+            mention=entry.mention,
+            habbo_user=habbo_user,
+            hotel=entry.hotel
         )
         
         # Enviar como nova mensagem em vez de editar a existente
-        await ctx.send(formatted_msg)
+        channel = entry.channel(bot)
+        if channel is not None:
+            await channel.send(formatted_msg)
+        return True
         
-        del active_verifications[user_id]
+    if result['verified']:
+        # Use exact name returned by API and finish in the background
+        remove_verification(user_id, entry)
+        spawn_task(complete_verification(entry, result['exact_name']))
+        return True
+    
+    # Keep exact name for the expiration message
+    if result['exact_name'] != habbo_user:
+        entry.exact_name = result['exact_name']
+    # Let the polling policy see the motto to pick the next interval
+    if 'motto' in result:
+        entry.polling.observe(result['motto'])
+    return False
 
-@bot.command(name=VERIFY_COMMAND)
-async def verify(ctx, habbo_user=None):
-    if habbo_user is None:
-        # Get message from messages.json or use default
-        no_username_msg = MESSAGES.get('verify', {}).get('no_username', "{mention} You need to provide your Habbo username. Example: `{prefix}{command} YourHabboUser`")
-        await ctx.send(no_username_msg.format(
-            mention=ctx.author.mention,
-            prefix=PREFIX,
-            command=VERIFY_COMMAND
-        ))
+# Function called by the profile source when the profile of a watched name changes
+def profile_changed(hotel, name, profile):
+    for user_id in list(watchers.get((hotel, name.lower()), ())):
+        entry = active_verifications.get(user_id)
+        if entry is not None:
+            result = check_profile(entry.habbo_user, entry.code, profile)
+            spawn_task(handle_result(user_id, entry, result))
+
+# Function called when the profile feed is lost: pending verifications were only polled every
+# PROFILE_FEED_FALLBACK_INTERVAL, so they are polled with the polling strategy again
+def profile_feed_lost():
+    for user_id, entry in active_verifications.items():
+        scheduler.register(user_id, entry.expires_in, polling_policy.next_interval(entry.polling))
+
+# Function called by the scheduler when a verification time expires
+async def expire_verification(user_id):
+    entry = active_verifications.get(user_id)
+    if entry is None:
         return
+    remove_verification(user_id, entry)
+    record_outcome(entry, 'expired')
     
+    channel = entry.channel(bot)
+    if channel is None:
+        return
+    
+    formatted_msg = templates.render('verification_process', 'expired', entry.guild(bot),
+        mention=entry.mention,
+        prefix=PREFIX,
+        command=VERIFY_COMMAND,
+        habbo_user=entry.display_name
+    )
+    
+    # Enviar como nova mensagem em vez de editar a existente
+    await channel.send(formatted_msg)
+
+# Polling strategy and central scheduler polling every pending verification (created by create_app)
+polling_policy = None
+scheduler = None
+
+# Seconds until the next poll of a verification, chosen by the configured polling strategy
+def next_poll_interval(user_id):
+    if profile_source.connected:
+        # Changes are pushed, polling is only a safety net
+        return PROFILE_FEED_FALLBACK_INTERVAL
+    return polling_policy.next_interval(active_verifications[user_id].polling)
+
+# Per-shard poll latency of this process
+shard_stats = ShardStats()
+
+# Function to send per-shard queue depth and poll latency to the sharding coordinator
+async def report_shard_stats():
+    while True:
+        await asyncio.sleep(SHARD_REPORT_INTERVAL)
+        queue_depths = {}
+        for entry in active_verifications.values():
+            shard_id = shard_of(entry.guild_id)
+            queue_depths[shard_id] = queue_depths.get(shard_id, 0) + 1
+        bot.shard_reports.put((bot.worker_index, shard_stats.snapshot(queue_depths)))
+
+# Function to run this module as one worker process of the sharding coordinator
+def run_shard_worker(worker_index, shard_ids, shard_count, reports):
+    app = create_app()
+    app.worker_index = worker_index
+    app.shard_ids = shard_ids
+    app.shard_count = shard_count
+    app.shard_reports = reports
+    app.run(TOKEN)
+
+@commands.command(name=VERIFY_COMMAND)
+@commands.guild_only()
+async def verify(ctx, habbo_user=None, hotel=None):
     user_id = ctx.author.id
     
     # Check if user already has a verification in progress
     if user_id in active_verifications:
-        # Get message from messages.json or use default
-        already_in_progress_msg = MESSAGES.get('verify', {}).get('already_in_progress', "{mention} You already have a verification in progress. Use `{prefix}cancel` to cancel.")
-        formatted_msg = already_in_progress_msg.format(
+        formatted_msg = templates.render('verify', 'already_in_progress', ctx.guild,
             mention=ctx.author.mention,
             prefix=PREFIX
         )
@@ -345,16 +588,45 @@ async def verify(ctx, habbo_user=None):
         await ctx.send(formatted_msg)
         return
     
+    # Use the given hotel or the one of the guild
+    if hotel is not None:
+        server = habbo_hotels.resolve(hotel)
+        if server is None:
+            await ctx.send(templates.render('verify', 'unknown_hotel', ctx.guild,
+                mention=ctx.author.mention,
+                hotel=hotel,
+                hotels=', '.join(habbo_hotels.hotels)
+            ))
+            return
+        hotel = server
+    else:
+        hotel = guild_hotel(ctx.guild)
+    
+    # Members verified recently on this hotel (as habbo_user when given) get the role without a new code,
+    # if their account still exists
+    identity = await identities.lookup(user_id, hotel, habbo_user)
+    exact_name = await confirm_identity(identity) if identity is not None else None
+    if exact_name is not None:
+        entry = PendingVerification.start(ctx, None, exact_name, hotel, '')
+        await complete_verification(entry, exact_name, reused=True)
+        return
+    
+    if habbo_user is None:
+        await ctx.send(templates.render('verify', 'no_username', ctx.guild,
+            mention=ctx.author.mention,
+            prefix=PREFIX,
+            command=VERIFY_COMMAND
+        ))
+        return
+    
     # Generate verification code
     code = generate_code()
     
-    # Get instructions message from messages.json or use default
-    instructions_msg = MESSAGES.get('verify', {}).get('instructions', "{mention} Starting verification for Habbo user **{habbo_user}**\n\n**Instructions:**\n1. Access your Habbo account\n2. Change your motto to: `{code}`\n3. Wait for automatic verification\n\nVerification will expire in {expiration_minutes} minutes. Use `{prefix}cancel` to cancel the process.")
-    
-    # Format the message with the appropriate values
-    formatted_msg = instructions_msg.format(
+    # Format the instructions with the appropriate values
+    formatted_msg = templates.render('verify', 'instructions', ctx.guild,
         mention=ctx.author.mention,
         habbo_user=habbo_user,
+        hotel=hotel,
         code=code,
         expiration_minutes=EXPIRATION_TIME//60,
         prefix=PREFIX
@@ -364,29 +636,22 @@ async def verify(ctx, habbo_user=None):
     message = await ctx.send(formatted_msg)
     
     # Start verification process
-    task = asyncio.create_task(verification_process(ctx, user_id, habbo_user, code))
-    active_verifications[user_id] = {
-        'habbo_user': habbo_user,
-        'code': code,
-        'expires_at': datetime.now() + timedelta(seconds=EXPIRATION_TIME),
-        'task': task,
-        'message': message
-    }
-
-@bot.command(name="cancel")
+    add_verification(PendingVerification.start(ctx, message, habbo_user, hotel, code))
+
+@commands.command(name="cancel")
 async def cancel(ctx):
     user_id = ctx.author.id
     
     if user_id in active_verifications:
         # Get existing message
-        existing_message = active_verifications[user_id].get('message')
+        entry = active_verifications[user_id]
+        existing_message = entry.message(entry.channel(bot))
         
-        # Cancel task
-        active_verifications[user_id]['task'].cancel()
+        # Stop polling
+        record_outcome(entry, 'cancelled')
+        remove_verification(user_id)
         
-        # Get message from messages.json or use default
-        success_msg = MESSAGES.get('cancel', {}).get('success', "{mention} Your verification has been cancelled.")
-        formatted_msg = success_msg.format(
+        formatted_msg = templates.render('cancel', 'success', ctx.guild,
             mention=ctx.author.mention
         )
         
@@ -395,50 +660,43 @@ async def cancel(ctx):
             await existing_message.edit(content=formatted_msg)
         else:
             await ctx.send(formatted_msg)
-            
-        del active_verifications[user_id]
     else:
-        # Get message from messages.json or use default
-        no_verification_msg = MESSAGES.get('cancel', {}).get('no_verification', "{mention} You don't have any verification in progress.")
-        formatted_msg = no_verification_msg.format(
+        formatted_msg = templates.render('cancel', 'no_verification', ctx.guild,
             mention=ctx.author.mention
         )
         await ctx.send(formatted_msg)
 
-@bot.command(name="restart")
+@commands.command(name="restart")
 async def restart(ctx):
     user_id = ctx.author.id
     
     if user_id in active_verifications:
-        habbo_user = active_verifications[user_id]['habbo_user']
-        existing_message = active_verifications[user_id].get('message')
+        entry = active_verifications[user_id]
+        habbo_user = entry.habbo_user
+        hotel = entry.hotel
+        existing_message = entry.message(entry.channel(bot))
         
-        # Cancel current task
-        active_verifications[user_id]['task'].cancel()
+        # Stop current verification
+        remove_verification(user_id)
         
         # If there's an existing message, update it informing restart
         if existing_message:
-            # Get message from messages.json or use default
-            in_progress_msg = MESSAGES.get('restart', {}).get('in_progress', "{mention} Restarting verification for user **{habbo_user}**...")
-            formatted_msg = in_progress_msg.format(
+            formatted_msg = templates.render('restart', 'in_progress', ctx.guild,
                 mention=ctx.author.mention,
                 habbo_user=habbo_user
             )
             await existing_message.edit(content=formatted_msg)
             
-            # Remove current verification
-            del active_verifications[user_id]
-            
             # Generate new code
             code = generate_code()
             
-            # Get message from messages.json or use default
-            instructions_msg = MESSAGES.get('restart', {}).get('instructions', "{mention} Restarting verification for Habbo user **{habbo_user}**\n\n**Instructions:**\n1. Access your Habbo account\n2. Change your motto to: `{code}`\n3. Wait for automatic verification (we check every {interval} seconds)\n\nVerification will expire in {expiration_minutes} minutes. Use `{prefix}cancel` to cancel the process.")
-            formatted_msg = instructions_msg.format(
+            formatted_msg = templates.render('restart', 'instructions', ctx.guild,
                 mention=ctx.author.mention,
                 habbo_user=habbo_user,
+                hotel=hotel,
                 code=code,
-                interval=VERIFICATION_INTERVAL,
+                # First poll interval of the strategy in whole seconds, still supplied for customised messages that show it
+                interval=round(polling_policy.next_interval(PollingState())),
                 expiration_minutes=EXPIRATION_TIME//60,
                 prefix=PREFIX
             )
@@ -446,29 +704,170 @@ async def restart(ctx):
             # Update message with new instructions
             await existing_message.edit(content=formatted_msg)
             
-            # Start new verification process
-            task = asyncio.create_task(verification_process(ctx, user_id, habbo_user, code))
-            active_verifications[user_id] = {
-                'habbo_user': habbo_user,
-                'code': code,
-                'expires_at': datetime.now() + timedelta(seconds=EXPIRATION_TIME),
-                'task': task,
-                'message': existing_message
-            }
+            # Start new verification process in the channel of the existing message
+            add_verification(PendingVerification(user_id, entry.guild_id, entry.channel_id, entry.message_id,
+                                                 habbo_user, hotel, code, time.monotonic() + EXPIRATION_TIME))
         else:
-            # If no existing message, remove verification and call verify command again
-            del active_verifications[user_id]
-            await ctx.invoke(bot.get_command(VERIFY_COMMAND), habbo_user=habbo_user)
+            # If no existing message, call verify command again
+            await ctx.invoke(bot.get_command(VERIFY_COMMAND), habbo_user=habbo_user, hotel=hotel)
     else:
-        # Get message from messages.json or use default
-        no_verification_msg = MESSAGES.get('restart', {}).get('no_verification', "{mention} You don't have any verification in progress to restart.")
-        formatted_msg = no_verification_msg.format(
+        formatted_msg = templates.render('restart', 'no_verification', ctx.guild,
             mention=ctx.author.mention
         )
         await ctx.send(formatted_msg)
 
-# Start the bot
-# Check if token exists before running the bot
-if TOKEN is None:
-    raise ValueError("Discord token not found in environment variables")
-bot.run(TOKEN)
+@commands.command(name="hotel")
+@commands.guild_only()
+async def hotel(ctx, server=None):
+    if server is None:
+        await ctx.send(templates.render('hotel', 'current', ctx.guild,
+            mention=ctx.author.mention,
+            hotel=guild_hotel(ctx.guild),
+            hotels=', '.join(habbo_hotels.hotels)
+        ))
+        return
+    
+    if not ctx.author.guild_permissions.manage_guild:
+        await ctx.send(templates.render('hotel', 'no_permission', ctx.guild, mention=ctx.author.mention))
+        return
+    
+    resolved = habbo_hotels.resolve(server)
+    if resolved is None:
+        await ctx.send(templates.render('verify', 'unknown_hotel', ctx.guild,
+            mention=ctx.author.mention,
+            hotel=server,
+            hotels=', '.join(habbo_hotels.hotels)
+        ))
+        return
+    
+    guild_hotels[ctx.guild.id] = resolved
+    await store.save_guild_hotel(ctx.guild.id, resolved)
+    
+    await ctx.send(templates.render('hotel', 'changed', ctx.guild, mention=ctx.author.mention, hotel=resolved))
+
+# Audits running in each guild: {guild_id: asyncio.Task}
+running_audits = {}
+
+# Function to run an audit and keep its progress on a single edited message
+async def run_audit(ctx, audit_run, restart):
+    counts = dict(scanned=0, checked=0, ok=0, missing=0, mismatch=0, errors=0, stripped=0)
+    message = await ctx.send(templates.render('audit', 'progress', ctx.guild, **counts))
+    
+    async def progress(checkpoint, done):
+        if done:
+            await message.edit(content=templates.render('audit', 'finished', ctx.guild, mention=ctx.author.mention, **checkpoint))
+        else:
+            await message.edit(content=templates.render('audit', 'progress', ctx.guild, **checkpoint))
+    
+    try:
+        checkpoint = await audit_run.run(restart=restart, progress=progress)
+    except asyncio.CancelledError:
+        await message.edit(content=templates.render('audit', 'stopped', ctx.guild, mention=ctx.author.mention))
+        raise
+    except Exception as e:
+        print(f"Error running audit: {e}")
+        await message.edit(content=templates.render('audit', 'error', ctx.guild, mention=ctx.author.mention, error=str(e)))
+        return
+    
+    # Attach the report of flagged members
+    if checkpoint['missing'] or checkpoint['mismatch']:
+        await ctx.send(file=discord.File(audit_run.report_path))
+
+@commands.command(name="audit")
+@commands.guild_only()
+async def audit(ctx, mode='report', option=None):
+    if not ctx.author.guild_permissions.manage_guild:
+        await ctx.send(templates.render('audit', 'no_permission', ctx.guild, mention=ctx.author.mention))
+        return
+    
+    guild_id = ctx.guild.id
+    if mode == 'stop':
+        task = running_audits.get(guild_id)
+        if task is not None:
+            task.cancel()
+        else:
+            await ctx.send(templates.render('audit', 'no_audit', ctx.guild, mention=ctx.author.mention))
+        return
+    
+    if mode not in ('report', 'strip'):
+        await ctx.send(templates.render('audit', 'usage', ctx.guild, mention=ctx.author.mention, prefix=PREFIX))
+        return
+    
+    # Members are matched to accounts by the nickname set on verification, without it most would be removed
+    if mode == 'strip' and not CHANGE_NICKNAME:
+        await ctx.send(templates.render('audit', 'strip_needs_nickname', ctx.guild, mention=ctx.author.mention, prefix=PREFIX))
+        return
+    
+    if guild_id in running_audits:
+        await ctx.send(templates.render('audit', 'already_running', ctx.guild, mention=ctx.author.mention, prefix=PREFIX))
+        return
+    
+    role = await discord_actions.get_role(ctx.guild, VERIFIED_ROLE, create=False)
+    if role is None:
+        await ctx.send(templates.render('audit', 'no_role', ctx.guild, mention=ctx.author.mention, role_name=VERIFIED_ROLE))
+        return
+    
+    audit_run = MemberAudit(ctx.guild, role, habbo_hotels.client(guild_hotel(ctx.guild)), store, discord_actions,
+                            identities, habbo_hotels, strip=mode == 'strip')
+    task = asyncio.create_task(run_audit(ctx, audit_run, restart=option == 'restart'))
+    running_audits[guild_id] = task
+    task.add_done_callback(lambda _: running_audits.pop(guild_id, None))
+
+# Function to apply rendering settings changed in config.py to the renderer of the current app
+async def reload_render_settings(values):
+    if image_renderer is not None:
+        await image_renderer.reload_settings(values)
+
+# Settings applied without restarting when config.py changes (registered once, create_app may run again
+# in the same process, e.g. in tests or tools)
+config_watcher.add_listener(tracer.reload)
+config_watcher.add_listener(reload_render_settings)
+
+# Create the bot and its components (one bot per process, the functions above use them through the globals)
+def create_app():
+    global templates, habbo_hotels, avatar_cache, store, identities, discord_actions, metrics_server, image_renderer
+    global profile_source, polling_policy, scheduler, bot
+    with profiler.phase('messages'):
+        templates = TemplateRegistry()
+        templates.load()
+    
+    with profiler.phase('create_app'):
+        habbo_hotels = HotelClients()
+        avatar_cache = AvatarCache(habbo_hotels)
+        store = open_store()
+        identities = IdentityIndex(store)
+        discord_actions = DiscordActionQueue()
+        metrics_server = MetricsServer()
+        image_renderer = ImageRenderer()
+        profile_source = create_source()
+        polling_policy = create_policy()
+        scheduler = VerificationScheduler(verification_process, expire_verification, next_interval=next_poll_interval)
+        
+        bot = VerifyBot(command_prefix=PREFIX, intents=intents, shard_count=SHARD_COUNT)
+        for listener in (on_ready, on_guild_role_create, on_guild_role_update, on_guild_role_delete):
+            bot.add_listener(listener)
+        for command in (verify, cancel, restart, hotel, audit):
+            bot.add_command(command)
+    return bot
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Discord bot verifying Habbo accounts")
+    parser.add_argument('--profile-startup', nargs='?', const='startup_profile.json', metavar='REPORT',
+                        help="Start, write the time spent in every startup phase to REPORT "
+                             "(default: startup_profile.json) and stop")
+    args = parser.parse_args(argv)
+    
+    # Check if token exists before running the bot
+    if TOKEN is None:
+        raise ValueError("Discord token not found in environment variables")
+    if WORKERS_PER_HOST > 1 and not args.profile_startup:
+        # Run ranges of shards in separate worker processes
+        run_coordinator(run_shard_worker)
+    else:
+        global profile_path
+        profile_path = args.profile_startup
+        create_app().run(TOKEN)
+
+# Start the bot (guarded so render worker processes and tools can import this module without starting it)
+if __name__ == '__main__':
+    main()
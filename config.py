@@ -6,10 +6,16 @@ PREFIX = '!'  # Command prefix
 VERIFY_COMMAND = 'verify'  # Command to start verification
 CODE_PREFIX = 'myt-'  # Verification code prefix
 EXPIRATION_TIME = 5 * 60  # Expiration time in seconds (default: 5 minutes)
-VERIFICATION_INTERVAL = 5  # Interval between verifications in seconds
+VERIFICATION_INTERVAL = 5  # Interval between verifications in seconds (used by the fixed polling strategy)
 VERIFIED_ROLE = 'Verified'  # Role name to be assigned
 CHANGE_NICKNAME = True  # Controls whether the bot should change user's nickname after verification
-SERVER_OPTION = 'habbo.com.br'  # Habbo server option (available: habbo.com / habbo.com.br / habbo.es / habbo.de)
+SERVER_OPTION = 'habbo.com.br'  # Default Habbo server for guilds that didn't choose one with the hotel command
+HOTELS = ['habbo.com.br', 'habbo.com', 'habbo.es', 'habbo.de', 'habbo.fr', 'habbo.it', 'habbo.nl', 'habbo.fi', 'habbo.com.tr']  # Hotels that can be verified against
+
+# Message settings
+MESSAGES_FILE = 'messages.json'  # File with the bot messages (checked at startup and reloaded when it changes)
+LOCALES_DIR = 'locales'  # Folder with per-language message overrides, e.g. locales/pt-BR.json for Portuguese servers
+TEMPLATE_RELOAD_INTERVAL = 5  # Seconds between checks for changes to the message files (0 = never reload)
 
 # Verification image settings
 VERIFICATION_TEXT = "Welcome \nto MYT!"  # Text displayed below username
@@ -18,4 +24,81 @@ BACKGROUND_IMAGE = "background.png"  # Path to custom background image
 CUSTOM_FONT = "Montserrat.ttf"  # Path to custom font
 FONT_SIZE = 24  # Font size
 MAIN_TEXT_COLOR = (255, 255, 255)  # Main text color
-SECONDARY_TEXT_COLOR = (255, 181, 77)  # Secondary text color
\ No newline at end of file
+SECONDARY_TEXT_COLOR = (255, 181, 77)  # Secondary text color
+RENDER_WORKERS = 2  # Worker processes that render verification images (0 = render in a background thread)
+RENDER_QUEUE_SIZE = 32  # Maximum images rendering or waiting for a worker, further renders wait for a free slot
+RENDER_PRELOAD = False  # Load Pillow and start the render workers at startup instead of on the first verified user
+RENDER_CACHE_SIZE = 8 * 1024 * 1024  # Maximum bytes of rendered images kept to send again to the same user (0 disables the cache)
+PNG_COMPRESS_LEVEL = 6  # zlib level of the verification image, 1 encodes fastest and 9 gives the smallest files
+IMAGE_QUANTIZE = False  # Reduce the verification image to a 256 color palette (smaller files, slower to encode)
+
+# Habbo API settings
+HABBO_API_TIMEOUT = 10  # Timeout for each Habbo API request in seconds
+HABBO_API_RETRIES = 2  # Retries for transient errors (timeouts, 429 and 5xx responses)
+HABBO_API_BACKOFF = 0.5  # Base delay in seconds for the exponential backoff between retries
+HABBO_API_POOL_SIZE = 100  # Maximum simultaneous keep-alive connections to the Habbo API of each hotel
+HABBO_API_RATE_LIMIT = 20  # Maximum Habbo API polls per second across all pending verifications and hotels
+HOTEL_RATE_LIMIT = 10  # Maximum requests per second sent to the API of a single hotel (0 = unlimited)
+CIRCUIT_BREAKER_FAILURES = 5  # Failed requests in a row after which requests to a hotel are paused
+CIRCUIT_BREAKER_RESET = 30  # Seconds before a paused hotel is tried again
+PROFILE_CACHE_TTL = 2  # Seconds a Habbo profile response is reused by other lookups (must be below VERIFICATION_INTERVAL and POLLING_MIN_INTERVAL)
+PROFILE_NOT_FOUND_TTL = 60  # Seconds a "user not found" response is cached
+PROFILE_CACHE_SIZE = 10000  # Maximum number of cached Habbo profiles
+
+# Polling settings
+POLLING_STRATEGY = 'exponential'  # How often pending verifications are checked (available: fixed / exponential / fast_then_backoff)
+POLLING_MIN_INTERVAL = 3  # Fastest interval in seconds, used early on and right after the motto changes
+POLLING_MAX_INTERVAL = 15  # Slowest interval in seconds once the motto stops changing
+POLLING_FAST_PERIOD = 30  # Seconds after the code is issued during which fast_then_backoff polls at the fastest interval
+POLLING_BACKOFF_FACTOR = 1.5  # How much the interval grows per poll without a motto change
+
+# Profile feed settings
+PROFILE_SOURCE = 'polling'  # How motto changes are found (available: polling = the bot polls the Habbo API / feed = pushed by poller_service.py, shared by every bot that subscribes)
+PROFILE_FEED_HOST = '127.0.0.1'  # Address of poller_service.py
+PROFILE_FEED_PORT = 9200  # Port of poller_service.py
+PROFILE_FEED_MIN_INTERVAL = 1  # Fastest interval in seconds of a name watched by several bots (its interval is divided by the number of bots)
+PROFILE_FEED_FALLBACK_INTERVAL = 60  # Seconds between the bot's own polls of a verification while the feed is connected
+PROFILE_FEED_RECONNECT = 5  # Seconds to wait before reconnecting to the poller service
+
+# Avatar cache settings
+AVATAR_CACHE_DIR = 'avatar_cache'  # Folder where downloaded avatars are stored (empty disables the disk cache)
+AVATAR_CACHE_MEMORY = 16 * 1024 * 1024  # Maximum bytes of avatars kept in memory
+AVATAR_CACHE_DISK = 256 * 1024 * 1024  # Maximum bytes of avatars kept on disk, the least recently used are deleted first
+AVATAR_CACHE_MAX_AGE = 60 * 60  # Seconds an avatar is used before revalidating it with habbo-imaging
+AVATAR_STALE_TIMEOUT = 3  # Seconds to wait for revalidation before using the cached copy
+
+# Storage settings
+STORAGE_PATH = 'verifications.db'  # SQLite file keeping pending verifications across restarts (empty keeps them in memory only)
+STORAGE_BATCH_SIZE = 500  # Queued changes that trigger an immediate write to the storage
+STORAGE_FLUSH_INTERVAL = 0.5  # Maximum seconds a change waits before being written to the storage
+
+# Verified identity settings
+IDENTITY_MAX_AGE = 30 * 24 * 60 * 60  # Seconds a verification is reused to verify the same member in another server right away (0 always asks for a new code)
+IDENTITY_CACHE_SIZE = 100000  # Members whose verified identity (or lack of one, for a minute) is kept in memory, the rest is read from the storage
+
+# Sharding settings
+SHARD_COUNT = 1  # Total gateway shards of the bot (None lets Discord choose, only with WORKERS_PER_HOST = 1)
+WORKERS_PER_HOST = 1  # Worker processes on this host, each one runs a range of shards (1 runs everything in one process)
+HOST_SHARD_IDS = None  # Shard ids handled by this host when running several hosts, e.g. range(0, 8) (None = all shards)
+SHARD_REPORT_INTERVAL = 30  # Seconds between per-shard queue depth and poll latency reports
+WORKER_RESTART_BACKOFF = 5  # Seconds before restarting a crashed worker, doubled after every crash in a row (up to 5 minutes)
+WORKER_MAX_RESTARTS = 5  # Crashes in a row after which a worker isn't restarted (each restart logs in to Discord again)
+
+# Audit settings
+AUDIT_CHUNK_SIZE = 200  # Members checked between two saved checkpoints
+AUDIT_CONCURRENCY = 10  # Habbo profile lookups running at the same time during an audit
+AUDIT_RATE_LIMIT = 5  # Maximum Habbo API requests per second used by an audit (leaves room for verifications)
+AUDIT_PROGRESS_INTERVAL = 10  # Seconds between edits of the audit progress message
+AUDIT_REPORT_DIR = 'audits'  # Folder where audit reports (CSV of flagged members) are written
+
+# Discord action settings
+DISCORD_ACTION_INTERVAL = 0.25  # Minimum seconds between queued role/nickname changes in the same guild
+DISCORD_ACTION_RETRIES = 3  # Retries for role/nickname changes that fail with 429 or 5xx responses
+DISCORD_ACTION_BACKOFF = 1  # Base delay in seconds for the exponential backoff between those retries
+
+# Metrics and tracing settings
+METRICS_ENABLED = True  # Serve Prometheus metrics on http://METRICS_HOST:METRICS_PORT/metrics
+METRICS_HOST = '127.0.0.1'  # Address of the metrics endpoint (keep it local unless Prometheus runs elsewhere)
+METRICS_PORT = 9100  # Port of the metrics endpoint (sharding workers use METRICS_PORT + worker index)
+TRACE_SAMPLE_RATE = 0.0  # Fraction of verifications traced, shown on /traces (0 disables, changes apply without restarting)
+TRACE_BUFFER = 100  # Number of finished traces kept for /traces
@@ -0,0 +1,77 @@
+# config.py watching
+# Settings that apply without restarting the bot (trace sample rate, rendering settings) are reread from
+# config.py by a single watcher. The file is checked every few seconds and run in a thread when it changed,
+# so reloading never blocks the event loop, then every listener gets the current values
+
+import asyncio
+import os
+import runpy
+
+import config
+
+# Seconds between checks of config.py
+CONFIG_CHECK_INTERVAL = 5
+
+
+def file_stamp(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except (OSError, TypeError):
+        return None
+
+
+class ConfigWatcher:
+    def __init__(self, path=config.__file__, interval=CONFIG_CHECK_INTERVAL):
+        self.path = path
+        self.interval = interval
+        # Values of the last version of config.py that ran without errors
+        self.values = vars(config)
+        self._stamp = file_stamp(path)
+        self._listeners = []
+        self._task = None
+
+    # listener(values) is a coroutine function called after every check with the current config.py values,
+    # so it can also look at files named by the settings (e.g. the background image)
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    # Run config.py again when it changed (in a thread)
+    def _reload(self):
+        stamp = file_stamp(self.path)
+        if stamp == self._stamp:
+            return
+        self._stamp = stamp
+        try:
+            self.values = runpy.run_path(self.path)
+        except Exception as e:
+            print(f"Error reloading {self.path}, keeping the previous settings: {e}")
+
+    async def check(self):
+        await asyncio.get_running_loop().run_in_executor(None, self._reload)
+        for listener in self._listeners:
+            try:
+                await listener(self.values)
+            except Exception as e:
+                print(f"Error applying settings of {self.path}: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.check()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+config_watcher = ConfigWatcher()
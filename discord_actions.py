@@ -0,0 +1,142 @@
+# Per-guild Discord action queue
+# Member edits of a guild run one at a time and spaced out, pending role and nickname changes of the
+# same member are merged into a single request, and transient failures (429, 5xx) are retried with backoff.
+# discord.py already waits on the rate limit bucket headers, the queue keeps bursts from reaching them
+
+import asyncio
+from collections import deque
+
+import discord
+
+from config import DISCORD_ACTION_INTERVAL, DISCORD_ACTION_RETRIES, DISCORD_ACTION_BACKOFF
+
+# Status codes worth retrying (rate limited or temporary Discord errors)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# Pending edit of one member
+class MemberEdit:
+    def __init__(self, member, future):
+        self.member = member
+        self.future = future
+        self.roles = []
+        self.removed_roles = []
+        self.nick = None
+
+
+class DiscordActionQueue:
+    def __init__(self, interval=DISCORD_ACTION_INTERVAL, retries=DISCORD_ACTION_RETRIES,
+                 backoff=DISCORD_ACTION_BACKOFF):
+        self.interval = interval
+        self.retries = retries
+        self.backoff = backoff
+        self._queues = {}
+        self._pending = {}
+        self._workers = {}
+        # Resolved roles: (guild_id, name) -> discord.Role
+        self._roles = {}
+
+    # Get a role by name from the cache, creating it if it doesn't exist
+    async def get_role(self, guild, name, create=True):
+        role = self._roles.get((guild.id, name))
+        if role is None:
+            role = discord.utils.get(guild.roles, name=name)
+            if role is None and create:
+                role = await guild.create_role(name=name, colour=discord.Colour.green())
+            if role is not None:
+                self._roles[(guild.id, name)] = role
+        return role
+
+    # Forget the cached roles of a guild (called when its roles change)
+    def invalidate_roles(self, guild_id):
+        for key in [key for key in self._roles if key[0] == guild_id]:
+            del self._roles[key]
+
+    # Queue a role and/or nickname change, returns an awaitable that finishes when it is applied
+    def edit_member(self, member, role=None, nick=None, remove_role=None):
+        key = (member.guild.id, member.id)
+        edit = self._pending.get(key)
+        # A queued edit whose caller cancelled it is skipped by the worker, changes go in a new one
+        if edit is None or edit.future.done():
+            edit = MemberEdit(member, asyncio.get_running_loop().create_future())
+            self._pending[key] = edit
+            self._queues.setdefault(member.guild.id, deque()).append(edit)
+            if member.guild.id not in self._workers:
+                self._workers[member.guild.id] = asyncio.create_task(self._run(member.guild.id))
+        if role is not None and role not in edit.roles:
+            edit.roles.append(role)
+            if role in edit.removed_roles:
+                edit.removed_roles.remove(role)
+        if remove_role is not None and remove_role not in edit.removed_roles:
+            edit.removed_roles.append(remove_role)
+            if remove_role in edit.roles:
+                edit.roles.remove(remove_role)
+        if nick is not None:
+            edit.nick = nick
+        return edit.future
+
+    async def _run(self, guild_id):
+        queue = self._queues[guild_id]
+        edit = None
+        try:
+            while queue:
+                edit = queue.popleft()
+                self._forget(guild_id, edit)
+                if edit.future.done():
+                    # Cancelled by the caller (e.g. a stopped audit) before it was applied
+                    continue
+                try:
+                    await self._apply(edit)
+                    if not edit.future.done():
+                        edit.future.set_result(None)
+                except Exception as e:
+                    if not edit.future.done():
+                        edit.future.set_exception(e)
+                await asyncio.sleep(self.interval)
+        finally:
+            # The edit in progress and those still queued when the worker stops (cancelled at shutdown) fail
+            # instead of waiting forever
+            stopped = [edit] if edit is not None else []
+            while queue:
+                stopped.append(queue.popleft())
+                self._forget(guild_id, stopped[-1])
+            for edit in stopped:
+                if not edit.future.done():
+                    edit.future.set_exception(discord.ClientException("Discord action queue stopped"))
+            del self._queues[guild_id]
+            del self._workers[guild_id]
+
+    def _forget(self, guild_id, edit):
+        key = (guild_id, edit.member.id)
+        if self._pending.get(key) is edit:
+            del self._pending[key]
+
+    async def _apply(self, edit):
+        # Roles are read again from the gateway cache, the queued member may be a snapshot taken long before
+        # (e.g. a page of an audit). Without a cached member (offline audit) the snapshot is used
+        member = edit.member.guild.get_member(edit.member.id) or edit.member
+        current = member.roles[1:]  # Without @everyone
+        added = [role for role in edit.roles if role not in current]
+        removed = [role for role in edit.removed_roles if role in current]
+        if edit.nick is not None:
+            # The nickname goes in a single member edit together with the full role list
+            changes = {'nick': edit.nick}
+            if added or removed:
+                changes['roles'] = [role for role in current if role not in removed] + added
+            await self._send(member.edit, **changes)
+            return
+        # Role changes alone use the per-role endpoints, which never touch the member's other roles
+        if added:
+            await self._send(member.add_roles, *added)
+        if removed:
+            await self._send(member.remove_roles, *removed)
+
+    # Run a Discord request, retrying rate limited and temporary errors with backoff
+    async def _send(self, request, *args, **kwargs):
+        for attempt in range(self.retries + 1):
+            try:
+                return await request(*args, **kwargs)
+            except discord.HTTPException as e:
+                if isinstance(e, discord.Forbidden) or e.status not in RETRY_STATUSES or attempt == self.retries:
+                    raise
+            await asyncio.sleep(self.backoff * (2 ** attempt))
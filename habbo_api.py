@@ -0,0 +1,320 @@
+# Async Habbo API client
+# All verifications of a hotel share one pooled keep-alive HTTP session so their network I/O overlaps
+# instead of blocking the event loop one request at a time. Every hotel gets its own pool, request
+# budget and circuit breaker, so a slow hotel API doesn't hold up the verifications of the others
+
+import asyncio
+import json
+import random
+import time
+from collections import OrderedDict
+
+import aiohttp
+
+from config import (SERVER_OPTION, HOTELS, HABBO_API_TIMEOUT, HABBO_API_RETRIES, HABBO_API_BACKOFF,
+                    HABBO_API_POOL_SIZE, HOTEL_RATE_LIMIT, CIRCUIT_BREAKER_FAILURES, CIRCUIT_BREAKER_RESET,
+                    VERIFICATION_INTERVAL, POLLING_MIN_INTERVAL, PROFILE_CACHE_TTL, PROFILE_NOT_FOUND_TTL, PROFILE_CACHE_SIZE)
+from metrics import HABBO_API_LATENCY, HABBO_API_CIRCUIT_OPEN
+
+# Status codes worth retrying (rate limited or temporary server errors)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Render parameters used for the verification avatar
+AVATAR_PARAMS = {
+    'action': 'std',
+    'direction': '2',
+    'head_direction': '3',
+    'img_format': 'png',
+    'gesture': 'sml',
+    'headonly': '0',
+    'size': 'l'
+}
+
+
+class HabboAPIError(Exception):
+    """Raised when the Habbo API can't be reached after all retries."""
+
+
+class HotelUnavailable(HabboAPIError):
+    """Raised without a request while the circuit breaker of a hotel is open."""
+
+
+# Stops requests to a hotel after repeated failures, then lets one trial request through every reset period
+class CircuitBreaker:
+    def __init__(self, server, failures=CIRCUIT_BREAKER_FAILURES, reset_after=CIRCUIT_BREAKER_RESET):
+        self.server = server
+        self.failures = failures
+        self.reset_after = reset_after
+        self._failed = 0
+        self._opened_at = None
+
+    @property
+    def open(self):
+        return self._opened_at is not None
+
+    def allow(self):
+        if self._opened_at is None:
+            return True
+        if time.monotonic() - self._opened_at >= self.reset_after:
+            # Half-open: this request is the trial, the others keep failing fast until it finishes
+            self._opened_at = time.monotonic()
+            return True
+        return False
+
+    def record_success(self):
+        if self._opened_at is not None:
+            print(f"Habbo API of {self.server} is back, closing its circuit breaker")
+            HABBO_API_CIRCUIT_OPEN.labels(self.server).set(0)
+        self._failed = 0
+        self._opened_at = None
+
+    def record_failure(self):
+        self._failed += 1
+        if self._failed >= self.failures:
+            if self._opened_at is None:
+                print(f"Habbo API of {self.server} keeps failing, pausing requests for {self.reset_after}s")
+                HABBO_API_CIRCUIT_OPEN.labels(self.server).set(1)
+            self._opened_at = time.monotonic()
+
+
+# Token bucket spacing the requests sent to one hotel (0 = unlimited)
+class RateLimiter:
+    def __init__(self, rate):
+        self.rate = rate
+        self._tokens = float(rate)
+        self._last_refill = time.monotonic()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self._tokens = min(float(self.rate), self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# Short-lived LRU cache of profile responses with single-flight lookups
+# Concurrent lookups of the same key share one request, and "not found" answers are kept longer
+class ProfileCache:
+    def __init__(self, ttl=PROFILE_CACHE_TTL, not_found_ttl=PROFILE_NOT_FOUND_TTL, max_size=PROFILE_CACHE_SIZE):
+        # A cached profile must not be served to the next poll of the same verification
+        fastest_poll = min(VERIFICATION_INTERVAL, POLLING_MIN_INTERVAL)
+        if ttl >= fastest_poll:
+            print(f"PROFILE_CACHE_TTL must be below the fastest poll interval, using {fastest_poll / 2}s")
+            ttl = fastest_poll / 2
+        self.ttl = ttl
+        self.not_found_ttl = not_found_ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_rate': (self.hits + self.coalesced) / lookups if lookups else 0.0
+        }
+
+    # Return the cached value for key, or run fetch() once for every concurrent caller
+    async def get(self, key, fetch):
+        cached = self._entries.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            del self._entries[key]
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            data = await fetch()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark as retrieved so an unawaited failure isn't logged twice
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+        future.set_result(data)
+        ttl = self.not_found_ttl if not data or 'error' in data else self.ttl
+        self._entries[key] = (time.monotonic() + ttl, data)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return data
+
+
+class HabboClient:
+    def __init__(self, server, base_url=None, timeout=HABBO_API_TIMEOUT, retries=HABBO_API_RETRIES,
+                 backoff=HABBO_API_BACKOFF, pool_size=HABBO_API_POOL_SIZE, rate_limit=HOTEL_RATE_LIMIT,
+                 profile_cache=None):
+        self.server = server
+        self.base_url = base_url or f"https://www.{server}"
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.session = None
+        # Profile keys include the server, so several clients can share one cache
+        self.profile_cache = profile_cache if profile_cache is not None else ProfileCache()
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.breaker = CircuitBreaker(server)
+
+    # Create the shared session (must run inside the event loop, e.g. from setup_hook)
+    async def start(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, ttl_dns_cache=300, keepalive_timeout=30)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    # Seconds asked by a Retry-After header, None when there is none or it isn't a number of seconds
+    @staticmethod
+    def _parse_retry_after(value):
+        try:
+            return max(0.0, float(value)) if value else None
+        except ValueError:
+            return None
+
+    # Delay before the next attempt: exponential backoff with jitter, or the server's Retry-After
+    def _retry_delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return retry_after
+        return self.backoff * (2 ** attempt) + random.uniform(0, self.backoff)
+
+    # GET with retries for transient errors, returns (status, body, headers)
+    async def _get(self, path, params, headers=None):
+        await self.start()
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                raise HotelUnavailable(f"Habbo API of {self.server} is unavailable, skipping {url}")
+            await self.rate_limiter.acquire()
+            retry_after = None
+            started = time.perf_counter()
+            try:
+                async with self.session.get(url, params=params, headers=headers) as response:
+                    body = await response.read()
+                    HABBO_API_LATENCY.labels(self.server, path, response.status).observe(time.perf_counter() - started)
+                    if response.status not in RETRY_STATUSES:
+                        self.breaker.record_success()
+                        return response.status, body, response.headers
+                    self.breaker.record_failure()
+                    retry_after = self._parse_retry_after(response.headers.get('Retry-After'))
+                    # A longer wait than a request may take would hold every lookup of this profile (and the
+                    # verification polling it), the next poll tries again instead
+                    if attempt == self.retries or (retry_after is not None and retry_after > self.timeout):
+                        return response.status, body, response.headers
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                HABBO_API_LATENCY.labels(self.server, path, 'error').observe(time.perf_counter() - started)
+                self.breaker.record_failure()
+                if attempt == self.retries:
+                    raise HabboAPIError(f"Request to {url} failed: {e!r}") from e
+            await asyncio.sleep(self._retry_delay(attempt, retry_after))
+
+    # Get public profile data for a Habbo user (shared between callers, don't modify it)
+    # Bulk lookups pass cache=False so they don't evict the profiles of pending verifications
+    async def get_user(self, name, cache=True):
+        if not cache:
+            return await self._fetch_user(name)
+        return await self.profile_cache.get((self.server, name.lower()), lambda: self._fetch_user(name))
+
+    # Only a 404 means the user doesn't exist (returned as {'error': ...}), any other failure raises
+    # HabboAPIError so it isn't taken (and cached) as a missing profile
+    async def _fetch_user(self, name):
+        status, body, _ = await self._get('/api/public/users', {'name': name})
+        if status == 404:
+            return {'error': 'not-found'}
+        if status != 200:
+            raise HabboAPIError(f"Habbo API returned status {status} for {name}")
+        try:
+            return json.loads(body)
+        except ValueError as e:
+            raise HabboAPIError(f"Invalid response from Habbo API (status {status})") from e
+
+    # Download the avatar image of a Habbo user as PNG bytes
+    async def get_avatar(self, name):
+        status, body, _ = await self.fetch_avatar(name)
+        if status != 200:
+            raise HabboAPIError(f"Could not download avatar for {name} (status {status})")
+        return body
+
+    # Conditional avatar download, returns (status, body, headers) where status 304 means unchanged
+    async def fetch_avatar(self, name, etag=None, last_modified=None):
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return await self._get('/habbo-imaging/avatarimage', {'user': name, **AVATAR_PARAMS}, headers)
+
+
+# One client per hotel, created the first time a hotel is used. The clients share the profile cache
+class HotelClients:
+    def __init__(self, hotels=HOTELS, default=SERVER_OPTION):
+        self.hotels = list(hotels)
+        if default not in self.hotels:
+            self.hotels.insert(0, default)
+        self.default = default
+        self.profile_cache = ProfileCache()
+        self._clients = {}
+
+    # Full hotel domain for user input like "de", ".com.br", "habbo.es" or "www.habbo.com", None if unknown
+    def resolve(self, value):
+        value = value.strip().lower()
+        if value.startswith('https://'):
+            value = value[len('https://'):]
+        value = value.rstrip('/')
+        if value.startswith('www.'):
+            value = value[len('www.'):]
+        if not value.startswith('habbo.'):
+            value = 'habbo.' + value.lstrip('.')
+        return value if value in self.hotels else None
+
+    def client(self, server=None):
+        server = server or self.default
+        client = self._clients.get(server)
+        if client is None:
+            if server not in self.hotels:
+                raise HabboAPIError(f"Unknown hotel {server}")
+            client = self._clients[server] = HabboClient(server, profile_cache=self.profile_cache)
+        return client
+
+    # Open the pool of the default hotel, the others are opened on their first request
+    async def start(self):
+        await self.client().start()
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.close()
+
+    def stats(self):
+        return {server: {'circuit_open': client.breaker.open} for server, client in self._clients.items()}
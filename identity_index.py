@@ -0,0 +1,171 @@
+# Verified identity index
+# Remembers the Habbo account every member was last verified as, whatever the guild, so a member who
+# verifies again in another guild gets the role right away instead of setting a new code. Identities
+# live in the store, the most recently used ones are kept in memory so repeated lookups don't touch it
+#
+# Offline usage: python identity_index.py export FILE | import FILE (CSV with user_id, hotel, habbo_name, verified_at)
+
+import argparse
+import asyncio
+import csv
+import time
+from collections import OrderedDict
+
+from config import IDENTITY_MAX_AGE, IDENTITY_CACHE_SIZE
+from storage import IDENTITY_FIELDS
+
+# Identities written to the store in one transaction by an import, or read in one page by an export
+CHUNK_SIZE = 10000
+
+# Seconds a member known to have no identity isn't looked up again (another sharding worker may record one)
+UNKNOWN_TTL = 60
+
+
+class IdentityIndex:
+    def __init__(self, store, max_age=IDENTITY_MAX_AGE, cache_size=IDENTITY_CACHE_SIZE):
+        self.store = store
+        self.max_age = max_age
+        self.cache_size = cache_size
+        # user_id -> (hotel, habbo_name, verified_at), least recently used first
+        self._cache = OrderedDict()
+        # Members without an identity: user_id -> time.monotonic() until which that is trusted
+        self._unknown = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {'cached': len(self._cache), 'unknown': len(self._unknown), 'hits': self.hits, 'misses': self.misses}
+
+    def _remember(self, user_id, identity):
+        self._cache[user_id] = identity
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _remember_unknown(self, user_id):
+        self._unknown[user_id] = time.monotonic() + UNKNOWN_TTL
+        self._unknown.move_to_end(user_id)
+        while len(self._unknown) > self.cache_size:
+            self._unknown.popitem(last=False)
+
+    def _reusable(self, identity, hotel, habbo_user):
+        if identity is None or time.time() - identity[2] > self.max_age:
+            return False
+        if hotel is not None and identity[0] != hotel:
+            return False
+        return habbo_user is None or identity[1].lower() == habbo_user.lower()
+
+    # Identity verified recently enough to verify the member again without a code, on hotel and named
+    # habbo_user when they are given: {'user_id', 'hotel', 'habbo_name', 'verified_at'}, None otherwise
+    async def lookup(self, user_id, hotel=None, habbo_user=None):
+        if self.max_age <= 0:
+            return None
+        identity = self._cache.get(user_id)
+        if identity is not None and self._reusable(identity, hotel, habbo_user):
+            self.hits += 1
+            self._cache.move_to_end(user_id)
+        elif identity is None and self._unknown.get(user_id, 0) > time.monotonic():
+            self.hits += 1
+            return None
+        else:
+            # Not cached, or cached but maybe verified again since by another shard worker
+            self.misses += 1
+            record = await self.store.get_identity(user_id)
+            if record is None:
+                self._remember_unknown(user_id)
+                return None
+            self._unknown.pop(user_id, None)
+            identity = (record['hotel'], record['habbo_name'], record['verified_at'])
+            self._remember(user_id, identity)
+            if not self._reusable(identity, hotel, habbo_user):
+                return None
+        return dict(zip(IDENTITY_FIELDS, (user_id,) + identity))
+
+    # Save the account a member was just verified as (a failed write only costs them a new code next time)
+    async def record(self, user_id, hotel, habbo_name, verified_at=None):
+        identity = (hotel, habbo_name, time.time() if verified_at is None else verified_at)
+        self._remember(user_id, identity)
+        self._unknown.pop(user_id, None)
+        try:
+            await self.store.save_identities([(user_id,) + identity])
+        except Exception as e:
+            print(f"Error saving the identity of {user_id}: {e}")
+
+    # Forget the identities of members whose account is gone or renamed, they verify with a code again
+    async def forget(self, user_ids):
+        for user_id in user_ids:
+            self._cache.pop(user_id, None)
+            self._remember_unknown(user_id)
+        try:
+            await self.store.delete_identities(user_ids)
+        except Exception as e:
+            print(f"Error removing the identities of {len(user_ids)} members: {e}")
+
+
+# Write every identity of the store to a CSV file, page by page in user id order
+async def export_identities(store, path):
+    count = 0
+    after = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(IDENTITY_FIELDS)
+        while True:
+            rows = await store.load_identities(after, CHUNK_SIZE)
+            if not rows:
+                break
+            writer.writerows(rows)
+            count += len(rows)
+            after = rows[-1][0]
+    return count
+
+
+# Save the identities of a CSV file written by export_identities (or by hand), replacing those of the same
+# users. Invalid rows are skipped. Returns the number of identities imported and skipped
+async def import_identities(store, path):
+    imported = skipped = 0
+    chunk = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            try:
+                chunk.append((int(row['user_id']), row['hotel'], row['habbo_name'], float(row['verified_at'])))
+            except (KeyError, TypeError, ValueError):
+                skipped += 1
+                continue
+            if len(chunk) >= CHUNK_SIZE:
+                await store.save_identities(chunk)
+                imported += len(chunk)
+                chunk = []
+    if chunk:
+        await store.save_identities(chunk)
+        imported += len(chunk)
+    return imported, skipped
+
+
+async def run_cli(action, path):
+    from storage import open_store
+
+    store = open_store()
+    await store.start()
+    try:
+        started = time.perf_counter()
+        if action == 'export':
+            count = await export_identities(store, path)
+            print(f"Exported {count} identities to {path} in {time.perf_counter() - started:.1f}s")
+        else:
+            imported, skipped = await import_identities(store, path)
+            print(f"Imported {imported} identities from {path} in {time.perf_counter() - started:.1f}s"
+                  + (f", skipped {skipped} invalid rows" if skipped else ""))
+    finally:
+        await store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import the verified identities of the store")
+    parser.add_argument('action', choices=('export', 'import'))
+    parser.add_argument('path', help="CSV file with user_id, hotel, habbo_name and verified_at columns")
+    args = parser.parse_args()
+    asyncio.run(run_cli(args.action, args.path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+# Verification image rendering
+# Static assets (resized background and font) are prepared once per process, and the
+# per-user compositing and PNG encoding run in a worker pool so they never block the event loop.
+# Pillow is only imported by the process that renders, when it renders or prepares its assets.
+# Encoded images are cached by the hash of everything they are made of (rendering settings, asset
+# files, avatar and name), and the settings are reread when config.py or the asset files change (see config_watch)
+
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import config
+from config_watch import file_stamp
+from config import RENDER_WORKERS, RENDER_QUEUE_SIZE, RENDER_CACHE_SIZE
+
+IMAGE_SIZE = (500, 200)
+
+# config.py settings that change the rendered image
+RENDER_SETTINGS = ('VERIFICATION_TEXT', 'BACKGROUND_COLOR', 'BACKGROUND_IMAGE', 'CUSTOM_FONT', 'FONT_SIZE',
+                   'MAIN_TEXT_COLOR', 'SECONDARY_TEXT_COLOR', 'PNG_COMPRESS_LEVEL', 'IMAGE_QUANTIZE')
+
+# Assets prepared for the current process: (settings fingerprint, background, font)
+_assets = None
+
+
+# Rendering settings (from the imported config module when values isn't given) with their fingerprint,
+# which also covers the background and font files so replacing one of them changes it
+def load_settings(values=None):
+    settings = {name: (values or {}).get(name, getattr(config, name)) for name in RENDER_SETTINGS}
+    assets = [file_stamp(settings['BACKGROUND_IMAGE']), file_stamp(settings['CUSTOM_FONT'])]
+    data = json.dumps([settings, assets], sort_keys=True, default=str)
+    settings['fingerprint'] = hashlib.sha1(data.encode('utf-8')).hexdigest()
+    return settings
+
+
+# Load the background resized to the image size, or a solid color if it's missing
+def load_background(settings=None):
+    from PIL import Image
+    settings = settings or load_settings()
+    background_image = settings['BACKGROUND_IMAGE']
+    if background_image and os.path.exists(background_image):
+        try:
+            return Image.open(background_image).convert('RGBA').resize(IMAGE_SIZE)
+        except Exception as e:
+            print(f"Error loading background image: {e}")
+    return Image.new('RGBA', IMAGE_SIZE, settings['BACKGROUND_COLOR'])
+
+
+# Load custom font or use fallback
+def load_font(settings=None):
+    from PIL import ImageFont
+    settings = settings or load_settings()
+    custom_font, font_size = settings['CUSTOM_FONT'], settings['FONT_SIZE']
+    try:
+        if custom_font and os.path.exists(custom_font):
+            return ImageFont.truetype(custom_font, font_size)
+        # Fallback to system fonts
+        try:
+            return ImageFont.truetype("arialbd.ttf", font_size)  # Arial Bold
+        except IOError:
+            try:
+                return ImageFont.truetype("arial.ttf", font_size)  # Arial
+            except IOError:
+                return ImageFont.load_default()
+    except Exception as e:
+        print(f"Error loading font: {e}")
+        return ImageFont.load_default()
+
+
+# Prepare static assets (also used as the worker process initializer)
+def prepare_assets(settings=None):
+    global _assets
+    settings = settings or load_settings()
+    _assets = (settings['fingerprint'], load_background(settings), load_font(settings))
+
+
+# Composite avatar and text over the background and return the PNG bytes
+def render_image(avatar_bytes, habbo_user, settings=None):
+    from PIL import Image, ImageDraw
+    settings = settings or load_settings()
+    if _assets is None or _assets[0] != settings['fingerprint']:
+        prepare_assets(settings)
+    _, background, font = _assets
+
+    img = background.copy()
+    avatar_img = Image.open(BytesIO(avatar_bytes))
+    img.paste(avatar_img, (20, 0), avatar_img)
+
+    # Add custom text
+    draw = ImageDraw.Draw(img)
+    draw.text((200, 60), f"{habbo_user},", font=font, fill=settings['MAIN_TEXT_COLOR'])
+    draw.text((200, 90), settings['VERIFICATION_TEXT'], font=font, fill=settings['SECONDARY_TEXT_COLOR'])
+
+    if settings['IMAGE_QUANTIZE']:
+        # 256 color palette, smaller files for a little more encoding time
+        img = img.quantize(colors=256)
+    buffer = BytesIO()
+    img.save(buffer, 'PNG', compress_level=settings['PNG_COMPRESS_LEVEL'])
+    return buffer.getvalue()
+
+
+class ImageRenderer:
+    def __init__(self, workers=RENDER_WORKERS, queue_size=RENDER_QUEUE_SIZE, cache_bytes=RENDER_CACHE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.cache_bytes = cache_bytes
+        self.executor = None
+        self._slots = None
+        self.settings = load_settings()
+        # Content hash -> PNG bytes, least recently sent first
+        self._cache = OrderedDict()
+        self._cache_used = 0
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._cache),
+            'bytes': self._cache_used,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+    # Create the worker pool (workers=0 renders in the default thread pool instead)
+    # Assets are prepared on the first render, or right away with preload
+    def start(self, preload=False):
+        self._slots = asyncio.Semaphore(self.queue_size)
+        if self.workers > 0 and self.executor is None:
+            # Workers are spawned, forking the bot's threads (storage, executors) could deadlock them
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=prepare_assets,
+                                                mp_context=multiprocessing.get_context('spawn'))
+            if preload:
+                # Start the workers, they prepare their assets in the initializer
+                for _ in range(self.workers):
+                    self.executor.submit(os.getpid)
+        elif preload:
+            prepare_assets(self.settings)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    # Pick up changed rendering settings in config.py or changed asset files (config_watch listener, the
+    # asset files are checked in a thread). Workers reload their assets when the fingerprint they get differs
+    # from the one they prepared
+    async def reload_settings(self, values):
+        values = {name: values.get(name, self.settings[name]) for name in RENDER_SETTINGS}
+        settings = await asyncio.get_running_loop().run_in_executor(None, load_settings, values)
+        if settings['fingerprint'] != self.settings['fingerprint']:
+            print("Rendering settings or assets changed, cached images dropped")
+            self.settings = settings
+            self._cache.clear()
+            self._cache_used = 0
+
+    def _key(self, avatar_bytes, habbo_user):
+        digest = hashlib.sha1(avatar_bytes).hexdigest()
+        return hashlib.sha1(f"{self.settings['fingerprint']}|{digest}|{habbo_user}".encode('utf-8')).hexdigest()
+
+    def _remember(self, key, image):
+        if len(image) > self.cache_bytes:
+            return
+        self._cache[key] = image
+        self._cache_used += len(image)
+        while self._cache_used > self.cache_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_used -= len(evicted)
+
+    # Render off the event loop; when the queue is full callers wait for a free slot (backpressure)
+    # Images already rendered with the same settings, avatar and name are returned from the cache
+    async def render(self, avatar_bytes, habbo_user):
+        if self._slots is None:
+            self.start()
+        key = self._key(avatar_bytes, habbo_user)
+        image = self._cache.get(key)
+        if image is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return image
+
+        self.misses += 1
+        settings = self.settings
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            image = await loop.run_in_executor(self.executor, render_image, avatar_bytes, habbo_user, settings)
+        if settings is self.settings and key not in self._cache:
+            self._remember(key, image)
+        return image
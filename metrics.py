@@ -0,0 +1,295 @@
+# Metrics and tracing for the verification pipeline
+# Counters, gauges and histograms are exposed in Prometheus text format on a local HTTP endpoint,
+# and an optional sampling tracer records where the time of single verifications goes
+
+import asyncio
+import json
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from aiohttp import web
+
+from config import METRICS_HOST, METRICS_PORT, TRACE_SAMPLE_RATE, TRACE_BUFFER
+
+# Default histogram buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Every metric created, in the order they are exposed
+REGISTRY = []
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        REGISTRY.append(self)
+
+    # Child metric for a set of label values (a metric without labels is its own child)
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {child.value}"
+                for values, child in self._children.items()]
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    # Read the value from a function every time the metrics are collected
+    def set_function(self, function):
+        self.function = function
+
+    def _samples(self):
+        if self.function is not None:
+            try:
+                return [f"{self.name} {float(self.function())}"]
+            except Exception as e:
+                print(f"Error collecting metric {self.name}: {e}")
+                return []
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {child.value}"
+                for values, child in self._children.items()]
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    # Measure the time spent inside a with block
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _samples(self):
+        lines = []
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, child.counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, [('le', '+Inf')])} {child.count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, values)} {child.sum}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, values)} {child.count}")
+        return lines
+
+
+# Metrics of the verification pipeline
+HABBO_API_LATENCY = Histogram('habbo_api_request_seconds', 'Habbo API request latency', ['hotel', 'endpoint', 'status'])
+HABBO_API_CIRCUIT_OPEN = Gauge('habbo_api_circuit_open', 'Whether requests to a hotel are paused by its circuit breaker', ['hotel'])
+IMAGE_RENDER_TIME = Histogram('verification_image_seconds', 'Time to build the verification image')
+DISCORD_REST_LATENCY = Histogram('discord_rest_request_seconds', 'Discord REST request latency', ['method', 'route'])
+VERIFICATION_DURATION = Histogram('verification_duration_seconds', 'Time from code issued to role granted')
+VERIFICATION_OUTCOMES = Counter('verification_outcomes_total', 'Finished verifications by outcome', ['outcome'])
+ACTIVE_VERIFICATIONS = Gauge('active_verifications', 'Pending verifications')
+SCHEDULER_ROUND_TIME = Histogram('scheduler_round_seconds', 'Time for every poll of a scheduler round to finish')
+EVENT_LOOP_LAG = Gauge('event_loop_lag_seconds', 'How late the event loop woke up a periodic task')
+
+
+def render_metrics():
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+# Trace that isn't sampled, every call does nothing
+class NoopTrace:
+    @contextmanager
+    def span(self, name):
+        yield
+
+    def finish(self, **attributes):
+        pass
+
+
+# Shared by every unsampled verification
+NOOP_TRACE = NoopTrace()
+
+
+class Trace:
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.started = time.time()
+        self._started = time.perf_counter()
+        self.spans = []
+
+    # Record the time spent inside a with block (offsets are relative to the trace start)
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append({
+                'name': name,
+                'offset': round(started - self._started, 6),
+                'duration': round(time.perf_counter() - started, 6)
+            })
+
+    def finish(self, **attributes):
+        self.attributes.update(attributes)
+        self.tracer.finished.append({
+            'name': self.name,
+            'started_at': self.started,
+            'duration': round(time.perf_counter() - self._started, 6),
+            'attributes': self.attributes,
+            'spans': self.spans
+        })
+
+
+class Tracer:
+    def __init__(self, sample_rate=TRACE_SAMPLE_RATE, buffer=TRACE_BUFFER):
+        self.sample_rate = sample_rate
+        self.finished = deque(maxlen=buffer)
+
+    # Pick up a new TRACE_SAMPLE_RATE when config.py changes, without restarting (config_watch listener)
+    async def reload(self, values):
+        sample_rate = float(values.get('TRACE_SAMPLE_RATE', 0))
+        if sample_rate != self.sample_rate:
+            print(f"Trace sample rate changed to {sample_rate}")
+            self.sample_rate = sample_rate
+
+    def start(self, name, **attributes):
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return Trace(self, name, attributes)
+        return NOOP_TRACE
+
+
+tracer = Tracer()
+
+
+# Local HTTP endpoint serving /metrics (Prometheus format) and /traces (JSON), also measures loop lag
+class MetricsServer:
+    def __init__(self, host=METRICS_HOST, port=METRICS_PORT, lag_interval=0.5):
+        self.host = host
+        self.port = port
+        self.lag_interval = lag_interval
+        self.runner = None
+        self._task = None
+
+    async def _metrics(self, request):
+        return web.Response(text=render_metrics(), content_type='text/plain', charset='utf-8')
+
+    async def _traces(self, request):
+        return web.Response(text=json.dumps(list(tracer.finished)), content_type='application/json')
+
+    async def _monitor(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.lag_interval)
+            EVENT_LOOP_LAG.set(max(0.0, time.perf_counter() - started - self.lag_interval))
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self._metrics)
+        app.router.add_get('/traces', self._traces)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        try:
+            await web.TCPSite(self.runner, self.host, self.port).start()
+        except OSError as e:
+            # E.g. the port is taken by another exporter, the bot runs on without metrics
+            print(f"Could not serve metrics on {self.host}:{self.port}, metrics are disabled: {e}")
+            await self.runner.cleanup()
+            self.runner = None
+            return
+        self._task = asyncio.create_task(self._monitor())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
@@ -0,0 +1,99 @@
+# Pending verification record
+# Keeps only what a verification needs while it waits for the motto to change: Discord ids instead of the
+# context, member, channel and message objects, the code as bytes and a monotonic expiry. The Discord
+# objects are looked up from the client cache when a message has to be sent or the member edited
+
+import time
+
+import discord
+
+from config import EXPIRATION_TIME
+from metrics import NOOP_TRACE
+from polling_policy import PollingState
+
+
+class PendingVerification:
+    __slots__ = ('user_id', 'guild_id', 'channel_id', 'message_id', 'habbo_user', 'hotel', '_code', 'expires_at',
+                 'exact_name', 'polling', 'trace')
+
+    def __init__(self, user_id, guild_id, channel_id, message_id, habbo_user, hotel, code, expires_at):
+        self.user_id = user_id
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.message_id = message_id
+        self.habbo_user = habbo_user
+        self.hotel = hotel
+        self._code = code.encode('ascii')
+        # time.monotonic() at which the code expires
+        self.expires_at = expires_at
+        # Spelling returned by the API, kept only when it differs from habbo_user
+        self.exact_name = None
+        self.polling = PollingState()
+        self.trace = NOOP_TRACE
+
+    # New verification issued now for the member of ctx (message is the instructions message or None)
+    @classmethod
+    def start(cls, ctx, message, habbo_user, hotel, code, lifetime=EXPIRATION_TIME):
+        return cls(ctx.author.id, ctx.guild.id, ctx.channel.id, message.id if message else None, habbo_user, hotel,
+                   code, time.monotonic() + lifetime)
+
+    # Verification saved in the store, whose expiry is a unix timestamp
+    @classmethod
+    def from_record(cls, record, hotel):
+        expires_at = time.monotonic() + record['expires_at'] - time.time()
+        return cls(record['user_id'], record['guild_id'], record['channel_id'], record['message_id'],
+                   record['habbo_user'], record['hotel'] or hotel, record['code'], expires_at)
+
+    def to_record(self):
+        return {
+            'user_id': self.user_id,
+            'guild_id': self.guild_id,
+            'channel_id': self.channel_id,
+            'message_id': self.message_id,
+            'habbo_user': self.habbo_user,
+            'code': self.code,
+            'expires_at': time.time() + self.expires_in,
+            'hotel': self.hotel
+        }
+
+    @property
+    def code(self):
+        return self._code.decode('ascii')
+
+    @property
+    def expires_in(self):
+        return self.expires_at - time.monotonic()
+
+    @property
+    def mention(self):
+        return f"<@{self.user_id}>"
+
+    @property
+    def display_name(self):
+        return self.exact_name or self.habbo_user
+
+    def guild(self, client):
+        return client.get_guild(self.guild_id)
+
+    def channel(self, client):
+        guild = client.get_guild(self.guild_id)
+        return guild.get_channel_or_thread(self.channel_id) if guild is not None else None
+
+    # Instructions message as a partial message (enough to edit or delete it), None if there is none
+    def message(self, channel):
+        if self.message_id is None or channel is None:
+            return None
+        return channel.get_partial_message(self.message_id)
+
+    # Member from the cache, fetched when it isn't cached, None if they left the guild
+    async def member(self, client):
+        guild = client.get_guild(self.guild_id)
+        if guild is None:
+            return None
+        member = guild.get_member(self.user_id)
+        if member is None:
+            try:
+                member = await guild.fetch_member(self.user_id)
+            except discord.HTTPException:
+                return None
+        return member
@@ -0,0 +1,194 @@
+# Shared profile poller
+# Bots with PROFILE_SOURCE = 'feed' subscribe here to the Habbo names of their pending verifications.
+# Every watched name is polled once, at the intervals of the configured POLLING_STRATEGY, however many
+# bots watch it, under the HABBO_API_RATE_LIMIT budget, and its profile is pushed to the subscribers as
+# soon as it changes. A name watched by several bots spends the polls they would have made on their own
+# on polling faster (the interval is divided by the number of bots, down to PROFILE_FEED_MIN_INTERVAL)
+#
+# Usage: python poller_service.py [--host 127.0.0.1] [--port 9200] [--strategy exponential]
+
+import argparse
+import asyncio
+import json
+
+from config import (EXPIRATION_TIME, PROFILE_FEED_HOST, PROFILE_FEED_PORT, PROFILE_FEED_MIN_INTERVAL,
+                    HABBO_API_RATE_LIMIT, POLLING_STRATEGY)
+from habbo_api import HabboAPIError, HotelClients
+from polling_policy import STRATEGIES, PollingState, create_policy
+from profile_source import encode
+from scheduler import VerificationScheduler
+
+
+# Part of the profile the bots need: the exact name and the motto, or the error when it doesn't exist
+def profile_of(data):
+    if not data or 'error' in data:
+        return {'error': (data or {}).get('error', 'not-found')}
+    return {'name': data.get('name'), 'motto': data.get('motto')}
+
+
+class PollerService:
+    def __init__(self, host=PROFILE_FEED_HOST, port=PROFILE_FEED_PORT, policy=None,
+                 requests_per_second=HABBO_API_RATE_LIMIT, hotels=None, min_interval=PROFILE_FEED_MIN_INTERVAL):
+        self.host = host
+        self.port = port
+        self.hotels = hotels or HotelClients()
+        # Names are polled like the bots poll their verifications, so the feed never sends more requests
+        self.policy = policy or create_policy()
+        self.min_interval = min_interval
+        # (hotel, lowercase name) -> what the polls of that name have seen so far
+        self._polling = {}
+        # Names are dropped when nobody unwatched them in time (e.g. a bot stopped without closing)
+        self.scheduler = VerificationScheduler(self._poll, self._expire, requests_per_second=requests_per_second,
+                                               next_interval=self._next_interval)
+        # (hotel, lowercase name) -> writers of the subscribed bots
+        self._subscribers = {}
+        # (hotel, lowercase name) -> last profile pushed
+        self._profiles = {}
+        self._server = None
+        # Tasks serving the connected bots
+        self._connections = {}
+        self.polls = 0
+        self.pushed = 0
+
+    def stats(self):
+        return {
+            'names': len(self._subscribers),
+            'connections': len({writer for writers in self._subscribers.values() for writer in writers}),
+            'polls': self.polls,
+            'pushed': self.pushed
+        }
+
+    def _push(self, key, profile, writers):
+        message = encode({'op': 'profile', 'hotel': key[0], 'name': key[1], 'profile': profile})
+        for writer in writers:
+            if not writer.is_closing():
+                writer.write(message)
+                self.pushed += 1
+
+    async def _poll(self, key):
+        hotel, name = key
+        self.polls += 1
+        try:
+            data = await self.hotels.client(hotel).get_user(name, cache=False)
+        except (HabboAPIError, ValueError) as e:
+            print(f"Error polling {name} on {hotel}: {e}")
+            return False
+        profile = profile_of(data)
+        state = self._polling.get(key)
+        if state is not None and 'motto' in profile:
+            state.observe(profile['motto'])
+        if profile != self._profiles.get(key):
+            self._profiles[key] = profile
+            self._push(key, profile, self._subscribers.get(key, ()))
+        # A missing profile is pushed once, the bots stop watching it
+        return 'error' in profile
+
+    def _next_interval(self, key):
+        interval = self.policy.next_interval(self._polling[key])
+        subscribers = len(self._subscribers.get(key, ()))
+        if subscribers > 1:
+            # As many polls as the subscribed bots would have made on their own, but sooner
+            interval = max(self.min_interval, interval / subscribers)
+        return interval
+
+    async def _expire(self, key):
+        self._subscribers.pop(key, None)
+        self._profiles.pop(key, None)
+        self._polling.pop(key, None)
+
+    def watch(self, key, writer):
+        if key[0] not in self.hotels.hotels:
+            print(f"Ignoring watch of {key[1]} on unknown hotel {key[0]}")
+            return
+        writers = self._subscribers.setdefault(key, set())
+        writers.add(writer)
+        profile = self._profiles.get(key)
+        if profile is not None:
+            # Already polled for another bot, the new subscriber gets the last profile right away
+            self._push(key, profile, (writer,))
+        # Polled until the last verification watching it would have expired, a new verification waits for a
+        # new code so the polls start fast again
+        self._polling[key] = PollingState()
+        self.scheduler.register(key, EXPIRATION_TIME)
+
+    def unwatch(self, key, writer):
+        writers = self._subscribers.get(key)
+        if writers is None:
+            return
+        writers.discard(writer)
+        if not writers:
+            del self._subscribers[key]
+            self._profiles.pop(key, None)
+            self._polling.pop(key, None)
+            self.scheduler.deregister(key)
+
+    async def _handle(self, reader, writer):
+        watched = set()
+        self._connections[asyncio.current_task()] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                key = (message['hotel'], message['name'].lower())
+                if message['op'] == 'watch':
+                    watched.add(key)
+                    self.watch(key, writer)
+                elif message['op'] == 'unwatch':
+                    watched.discard(key)
+                    self.unwatch(key, writer)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Closing subscriber after an invalid message: {e}")
+        finally:
+            for key in watched:
+                self.unwatch(key, writer)
+            writer.close()
+            self._connections.pop(asyncio.current_task(), None)
+
+    async def start(self):
+        await self.hotels.start()
+        self.scheduler.start()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        # Port 0 listens on a free port
+        self.port = self._server.sockets[0].getsockname()[1]
+        print(f"Profile feed listening on {self.host}:{self.port}")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            # Disconnect the bots, which fall back to polling on their own
+            for writer in list(self._connections.values()):
+                writer.close()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+        await self.scheduler.stop()
+        await self.hotels.close()
+
+
+async def run(host, port, strategy):
+    service = PollerService(host, port, create_policy(strategy))
+    await service.start()
+    try:
+        while True:
+            await asyncio.sleep(60)
+            print(f"Profile feed: {service.stats()}")
+    finally:
+        await service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Poll the Habbo profiles watched by the bots and push their changes")
+    parser.add_argument('--host', default=PROFILE_FEED_HOST)
+    parser.add_argument('--port', type=int, default=PROFILE_FEED_PORT)
+    parser.add_argument('--strategy', choices=STRATEGIES, default=POLLING_STRATEGY, help="How often names are polled")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args.host, args.port, args.strategy))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
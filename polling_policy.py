@@ -0,0 +1,90 @@
+# Polling policies
+# Decide how long to wait before checking a pending verification again, based on how long it has been
+# pending and on what the last polls saw in the user's motto
+
+import time
+
+from config import (VERIFICATION_INTERVAL, POLLING_STRATEGY, POLLING_MIN_INTERVAL, POLLING_MAX_INTERVAL,
+                    POLLING_FAST_PERIOD, POLLING_BACKOFF_FACTOR)
+
+
+# What the polls of one verification have seen so far
+class PollingState:
+    __slots__ = ('started_at', 'polls', 'last_motto', 'unchanged', 'changed')
+
+    def __init__(self, now=None):
+        self.started_at = time.monotonic() if now is None else now
+        self.polls = 0
+        self.last_motto = None
+        # Polls in a row where the motto stayed the same
+        self.unchanged = 0
+        # Whether the last poll saw the motto change to something else than the code
+        self.changed = False
+
+    def observe(self, motto):
+        self.changed = self.polls > 0 and motto != self.last_motto
+        self.unchanged = 0 if self.changed else self.unchanged + 1
+        self.last_motto = motto
+        self.polls += 1
+
+
+# Base strategy, subclasses return the seconds until the next poll
+class PollingStrategy:
+    name = None
+
+    def next_interval(self, state, now=None):
+        raise NotImplementedError
+
+
+# Same interval for the whole verification (the original behaviour)
+class FixedInterval(PollingStrategy):
+    name = 'fixed'
+
+    def __init__(self, interval=VERIFICATION_INTERVAL):
+        self.interval = interval
+
+    def next_interval(self, state, now=None):
+        return self.interval
+
+
+# Wait longer after every poll where the motto didn't change, go back to fast polls when it changes
+class ExponentialBackoff(PollingStrategy):
+    name = 'exponential'
+
+    def __init__(self, min_interval=POLLING_MIN_INTERVAL, max_interval=POLLING_MAX_INTERVAL,
+                 factor=POLLING_BACKOFF_FACTOR):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+
+    def next_interval(self, state, now=None):
+        if state.changed:
+            return self.min_interval
+        return min(self.max_interval, self.min_interval * self.factor ** max(0, state.unchanged - 1))
+
+
+# Fast polls while the user is most likely changing the motto, then exponential backoff
+class FastThenBackoff(ExponentialBackoff):
+    name = 'fast_then_backoff'
+
+    def __init__(self, fast_period=POLLING_FAST_PERIOD, **kwargs):
+        super().__init__(**kwargs)
+        self.fast_period = fast_period
+
+    def next_interval(self, state, now=None):
+        now = time.monotonic() if now is None else now
+        if state.changed or now - state.started_at < self.fast_period:
+            return self.min_interval
+        # Past the fast period every wait grows with the time already spent waiting, which grows the
+        # interval by about the backoff factor per poll
+        waited = now - state.started_at - self.fast_period
+        return min(self.max_interval, self.min_interval + waited * (self.factor - 1))
+
+STRATEGIES = {strategy.name: strategy for strategy in (FixedInterval, ExponentialBackoff, FastThenBackoff)}
+
+
+# Create the strategy selected in config.py
+def create_policy(name=POLLING_STRATEGY):
+    if name not in STRATEGIES:
+        raise ValueError(f"Unknown POLLING_STRATEGY '{name}' (available: {', '.join(STRATEGIES)})")
+    return STRATEGIES[name]()
@@ -0,0 +1,152 @@
+# Profile change sources
+# Tell the bot when the profile of a Habbo name it is waiting on changes. With the default polling
+# source the scheduler polls every pending verification itself; the feed source subscribes to
+# poller_service.py, which polls every watched name once for all the bots connected to it and pushes
+# the profile as soon as the motto changes
+#
+# Feed protocol: one JSON object per line
+#   bot -> service: {"op": "watch" | "unwatch", "hotel": "habbo.com", "name": "user"}
+#   service -> bot: {"op": "profile", "hotel": "habbo.com", "name": "user", "profile": {"name", "motto"} | {"error"}}
+
+import asyncio
+import json
+
+from config import PROFILE_SOURCE, PROFILE_FEED_HOST, PROFILE_FEED_PORT, PROFILE_FEED_RECONNECT
+
+
+def encode(message):
+    return (json.dumps(message) + '\n').encode('utf-8')
+
+
+class ProfileChangeSource:
+    name = None
+
+    def __init__(self):
+        # listener(hotel, name, profile) is called with every profile pushed for a watched name
+        self.listener = None
+        # disconnected() is called when changes stop being pushed, so the bot goes back to its own polls
+        self.disconnected = None
+
+    # Whether changes are pushed right now, so the bot only needs to poll as a safety net
+    @property
+    def connected(self):
+        return False
+
+    async def start(self, listener, disconnected=None):
+        self.listener = listener
+        self.disconnected = disconnected
+
+    async def close(self):
+        pass
+
+    # Names are watched once per pending verification (the same name can be pending in several guilds)
+    def watch(self, hotel, name):
+        pass
+
+    def unwatch(self, hotel, name):
+        pass
+
+
+# The scheduler polls the Habbo API for every pending verification, nothing is pushed
+class PollingSource(ProfileChangeSource):
+    name = 'polling'
+
+
+# Profiles pushed by poller_service.py over a local TCP connection, reconnecting when it is lost
+class FeedSource(ProfileChangeSource):
+    name = 'feed'
+
+    def __init__(self, host=PROFILE_FEED_HOST, port=PROFILE_FEED_PORT, reconnect_delay=PROFILE_FEED_RECONNECT):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.reconnect_delay = reconnect_delay
+        # (hotel, lowercase name) -> number of pending verifications watching it
+        self._watched = {}
+        self._writer = None
+        self._task = None
+        self.pushed = 0
+
+    @property
+    def connected(self):
+        return self._writer is not None
+
+    async def start(self, listener, disconnected=None):
+        self.listener = listener
+        self.disconnected = disconnected
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _send(self, op, key):
+        if self._writer is not None and not self._writer.is_closing():
+            self._writer.write(encode({'op': op, 'hotel': key[0], 'name': key[1]}))
+
+    def watch(self, hotel, name):
+        key = (hotel, name.lower())
+        self._watched[key] = self._watched.get(key, 0) + 1
+        if self._watched[key] == 1:
+            self._send('watch', key)
+
+    def unwatch(self, hotel, name):
+        key = (hotel, name.lower())
+        count = self._watched.get(key, 0) - 1
+        if count > 0:
+            self._watched[key] = count
+        elif key in self._watched:
+            del self._watched[key]
+            self._send('unwatch', key)
+
+    async def _run(self):
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError as e:
+                print(f"Could not connect to the profile feed at {self.host}:{self.port}: {e}")
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+
+            print(f"Connected to the profile feed at {self.host}:{self.port}")
+            self._writer = writer
+            # Subscribe again to everything that is pending
+            for key in self._watched:
+                self._send('watch', key)
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    message = json.loads(line)
+                    if message.get('op') == 'profile':
+                        self.pushed += 1
+                        self.listener(message['hotel'], message['name'], message['profile'])
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Error reading the profile feed: {e}")
+            finally:
+                self._writer = None
+                writer.close()
+            print("Lost the profile feed, verifications are polled until it is back")
+            if self.disconnected is not None:
+                try:
+                    self.disconnected()
+                except Exception as e:
+                    print(f"Error switching back to polling: {e}")
+            await asyncio.sleep(self.reconnect_delay)
+
+
+SOURCES = {source.name: source for source in (PollingSource, FeedSource)}
+
+
+# Create the source selected in config.py
+def create_source(name=PROFILE_SOURCE):
+    if name not in SOURCES:
+        raise ValueError(f"Unknown PROFILE_SOURCE '{name}' (available: {', '.join(SOURCES)})")
+    return SOURCES[name]()
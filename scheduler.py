@@ -0,0 +1,196 @@
+# Central verification scheduler
+# Owns every pending verification in a deadline-ordered heap and runs poll rounds under a
+# global requests-per-second budget, instead of one polling task and timer per user
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+
+from config import VERIFICATION_INTERVAL, HABBO_API_RATE_LIMIT
+from metrics import SCHEDULER_ROUND_TIME
+
+# Positions inside a heap entry: [due, seq, key, expires_at, alive, queued]
+DUE, SEQ, KEY, EXPIRES_AT, ALIVE, QUEUED = range(6)
+
+
+class VerificationScheduler:
+    def __init__(self, poll, expire, interval=VERIFICATION_INTERVAL, requests_per_second=HABBO_API_RATE_LIMIT,
+                 history=100, next_interval=None):
+        # poll(key) -> True when the verification is finished, expire(key) is called once on timeout
+        self.poll = poll
+        self.expire = expire
+        self.interval = interval
+        # next_interval(key) -> seconds until the next poll of a key (a fixed interval when not given)
+        self.next_interval = next_interval
+        self.rate = requests_per_second
+        self._heap = []
+        self._entries = {}
+        self._in_flight = 0
+        self._counter = itertools.count()
+        self._wakeup = None
+        self._tasks = set()
+        self._tokens = float(requests_per_second)
+        self._last_refill = time.monotonic()
+        self._task = None
+        self._dead = 0
+        self.round_latencies = deque(maxlen=history)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    # Add a verification, polled after delay (right away by default) and then every interval until it expires
+    def register(self, key, expires_in, delay=0.0):
+        self.deregister(key)
+        now = time.monotonic()
+        entry = [min(now + delay, now + expires_in), next(self._counter), key, now + expires_in, True, True]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # Remove a verification (cancel/restart); its heap slot is skipped lazily when it reaches the top
+    def deregister(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry[ALIVE] = False
+            if entry[QUEUED]:
+                self._dead += 1
+            # Rebuild the heap once stale slots outnumber live ones
+            if self._dead > len(self._entries):
+                self._heap = [e for e in self._heap if e[ALIVE]]
+                heapq.heapify(self._heap)
+                self._dead = 0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        latencies = list(self.round_latencies)
+        return {
+            'pending': len(self._entries),
+            'in_flight': self._in_flight,
+            'last_round': latencies[-1] if latencies else 0.0,
+            'avg_round': sum(latencies) / len(latencies) if latencies else 0.0,
+            'max_round': max(latencies, default=0.0)
+        }
+
+    def _refill(self, now):
+        self._tokens = min(float(self.rate), self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    async def _sleep(self, delay):
+        # Sleep until the delay passes or a new verification is registered. asyncio.wait doesn't swallow a
+        # cancel (stop) that arrives as the event is set, like wait_for does before Python 3.12
+        self._wakeup.clear()
+        wakeup = asyncio.ensure_future(self._wakeup.wait())
+        try:
+            await asyncio.wait({wakeup}, timeout=delay)
+        finally:
+            wakeup.cancel()
+
+    async def _run(self):
+        while True:
+            while self._heap and not self._heap[0][ALIVE]:
+                heapq.heappop(self._heap)[QUEUED] = False
+                self._dead -= 1
+
+            if not self._heap:
+                await self._sleep(None)
+                continue
+
+            now = time.monotonic()
+            if self._heap[0][DUE] > now:
+                await self._sleep(self._heap[0][DUE] - now)
+                continue
+
+            self._refill(now)
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                continue
+
+            # Take due entries in deadline order while the request budget allows
+            batch = []
+            while self._heap and self._heap[0][DUE] <= now and self._tokens >= 1:
+                entry = heapq.heappop(self._heap)
+                entry[QUEUED] = False
+                if not entry[ALIVE]:
+                    self._dead -= 1
+                    continue
+                if entry[EXPIRES_AT] <= now:
+                    del self._entries[entry[KEY]]
+                    self._spawn(self._expire(entry[KEY]))
+                    continue
+                self._tokens -= 1
+                batch.append(entry)
+
+            if batch:
+                self._in_flight += len(batch)
+                self._spawn(self._round(batch))
+
+    # Keep a reference to background tasks so they aren't garbage collected mid-run
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # Poll one entry and reschedule it as soon as its own poll finishes, so a slow API (e.g. another
+    # hotel) doesn't delay the rest of the round
+    async def _poll(self, entry):
+        key = entry[KEY]
+        try:
+            finished = await self.poll(key)
+        except Exception as e:
+            print(f"Error polling verification {key}: {e}")
+            finished = False
+        self._in_flight -= 1
+
+        # Skip entries that were cancelled or restarted while being polled
+        if self._entries.get(key) is not entry:
+            return
+        if finished:
+            del self._entries[key]
+            return
+        # Next poll after the interval, but never later than the expiry so it is handled on time
+        entry[DUE] = min(time.monotonic() + self._interval_for(key), entry[EXPIRES_AT])
+        entry[SEQ] = next(self._counter)
+        entry[QUEUED] = True
+        heapq.heappush(self._heap, entry)
+        self._wakeup.set()
+
+    async def _round(self, batch):
+        started = time.monotonic()
+        await asyncio.gather(*(self._poll(entry) for entry in batch))
+        latency = time.monotonic() - started
+        self.round_latencies.append(latency)
+        SCHEDULER_ROUND_TIME.observe(latency)
+
+    def _interval_for(self, key):
+        if self.next_interval is None:
+            return self.interval
+        try:
+            return self.next_interval(key)
+        except Exception as e:
+            print(f"Error choosing the next poll of verification {key}: {e}")
+            return self.interval
+
+    async def _expire(self, key):
+        try:
+            await self.expire(key)
+        except Exception as e:
+            print(f"Error expiring verification {key}: {e}")
@@ -0,0 +1,143 @@
+# Multi-process sharding
+# The coordinator splits this host's gateway shards into ranges and runs each range in its own
+# worker process. A worker only polls the verifications started in guilds of its own shards, so the
+# Habbo polling workload is partitioned across processes together with the gateway traffic
+
+import multiprocessing
+import queue
+import time
+from collections import deque
+
+from config import (SHARD_COUNT, WORKERS_PER_HOST, HOST_SHARD_IDS, SHARD_REPORT_INTERVAL, WORKER_RESTART_BACKOFF,
+                    WORKER_MAX_RESTARTS)
+
+# Longest wait before restarting a crashed worker
+MAX_RESTART_DELAY = 300
+
+# Seconds a worker has to run before its next crash no longer counts as one in a row
+STABLE_UPTIME = 600
+
+
+# Shard that receives the events of a guild (same formula Discord uses)
+def shard_for_guild(guild_id, shard_count):
+    return (guild_id >> 22) % shard_count
+
+
+# Split shard ids into contiguous ranges, one per worker
+def shard_ranges(shard_ids, workers):
+    shard_ids = list(shard_ids)
+    workers = max(1, min(workers, len(shard_ids)))
+    size, extra = divmod(len(shard_ids), workers)
+    ranges = []
+    start = 0
+    for index in range(workers):
+        end = start + size + (1 if index < extra else 0)
+        ranges.append(shard_ids[start:end])
+        start = end
+    return ranges
+
+
+# Per-shard poll latency collected inside a worker
+class ShardStats:
+    def __init__(self, history=200):
+        self.history = history
+        self.poll_latencies = {}
+
+    def record_poll(self, shard_id, seconds):
+        latencies = self.poll_latencies.get(shard_id)
+        if latencies is None:
+            latencies = self.poll_latencies[shard_id] = deque(maxlen=self.history)
+        latencies.append(seconds)
+
+    # Report for every shard: {shard_id: {'queue_depth', 'poll_avg', 'poll_max'}}
+    def snapshot(self, queue_depths):
+        report = {}
+        for shard_id in set(queue_depths) | set(self.poll_latencies):
+            latencies = self.poll_latencies.get(shard_id) or ()
+            report[shard_id] = {
+                'queue_depth': queue_depths.get(shard_id, 0),
+                'poll_avg': sum(latencies) / len(latencies) if latencies else 0.0,
+                'poll_max': max(latencies, default=0.0)
+            }
+        return report
+
+
+def print_report(reports):
+    print(f"{'shard':>6}{'worker':>8}{'queue depth':>13}{'poll avg ms':>13}{'poll max ms':>13}")
+    for worker_index, report in sorted(reports.items()):
+        for shard_id, stats in sorted(report.items()):
+            print(f"{shard_id:>6}{worker_index:>8}{stats['queue_depth']:>13}"
+                  f"{1000 * stats['poll_avg']:>13.1f}{1000 * stats['poll_max']:>13.1f}")
+
+
+# Run one worker process per shard range and print their reports, restarting workers that crash with an
+# exponential backoff (a worker crashing max_restarts times in a row is given up, e.g. on an invalid token)
+# worker(worker_index, shard_ids, shard_count, reports) must put (worker_index, report) in reports
+def run_coordinator(worker, shard_count=SHARD_COUNT, workers=WORKERS_PER_HOST, shard_ids=HOST_SHARD_IDS,
+                    report_interval=SHARD_REPORT_INTERVAL, duration=None, quiet=False,
+                    restart_backoff=WORKER_RESTART_BACKOFF, max_restarts=WORKER_MAX_RESTARTS):
+    context = multiprocessing.get_context('spawn')
+    reports = context.Queue()
+    ranges = shard_ranges(shard_ids if shard_ids is not None else range(shard_count), workers)
+    processes = {}
+    latest = {}
+    started_at = {}
+    # Crashes in a row of each worker, and when the crashed ones are restarted
+    crashes = {}
+    restart_at = {}
+
+    def launch(index):
+        process = context.Process(target=worker, args=(index, ranges[index], shard_count, reports),
+                                  name=f"shard-worker-{index}")
+        process.start()
+        processes[index] = process
+        started_at[index] = time.monotonic()
+        if not quiet:
+            print(f"Worker {index} started with shards {ranges[index]}")
+
+    for index in range(len(ranges)):
+        launch(index)
+
+    deadline = time.monotonic() + duration if duration else None
+    next_report = time.monotonic() + report_interval
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            try:
+                worker_index, report = reports.get(timeout=0.5)
+                latest[worker_index] = report
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            for index, process in list(processes.items()):
+                if index in restart_at:
+                    if now >= restart_at[index]:
+                        del restart_at[index]
+                        launch(index)
+                elif not process.is_alive() and process.exitcode != 0:
+                    if now - started_at[index] >= STABLE_UPTIME:
+                        crashes[index] = 0
+                    crashes[index] = crashes.get(index, 0) + 1
+                    if crashes[index] > max_restarts:
+                        print(f"Worker {index} exited with code {process.exitcode} after {max_restarts} restarts "
+                              f"in a row, giving up")
+                        del processes[index]
+                        continue
+                    delay = min(restart_backoff * 2 ** (crashes[index] - 1), MAX_RESTART_DELAY)
+                    print(f"Worker {index} exited with code {process.exitcode}, restarting in {delay:g}s")
+                    restart_at[index] = now + delay
+            if not restart_at and not any(process.is_alive() for process in processes.values()):
+                break
+
+            if time.monotonic() >= next_report:
+                next_report = time.monotonic() + report_interval
+                if latest and not quiet:
+                    print_report(latest)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
+    return latest
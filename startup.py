@@ -0,0 +1,64 @@
+# Startup profiling
+# Measures how long each startup phase takes (imports, loading the messages, preparing the components,
+# connecting to the gateway...) so cold starts can be compared between releases and deployments
+
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+class StartupProfiler:
+    # started is the time.perf_counter() value startup is measured from (the first import of bot.py)
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.phases = []
+        self._last = self.started
+
+    # End a phase that started when the previous one ended
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append({'name': name, 'seconds': round(now - self._last, 4)})
+        self._last = now
+
+    # Measure the phase inside a with block
+    @contextmanager
+    def phase(self, name):
+        self._last = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.mark(name)
+
+    def report(self):
+        return {
+            'total_seconds': round(time.perf_counter() - self.started, 4),
+            'phases': self.phases,
+            'peak_rss_mb': peak_rss_mb(),
+            'modules_loaded': len(sys.modules),
+            'pillow_loaded': 'PIL' in sys.modules
+        }
+
+    def write(self, path):
+        report = self.report()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        for phase in report['phases']:
+            print(f"{phase['name']:<20}{1000 * phase['seconds']:>10.1f} ms")
+        print(f"{'total':<20}{1000 * report['total_seconds']:>10.1f} ms, peak RSS {report['peak_rss_mb']} MB")
+        print(f"Startup report written to {path}")
+        return report
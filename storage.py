@@ -0,0 +1,317 @@
+# Pending verification storage
+# Keeps pending codes, expiry and message ids outside the process so they survive restarts, together
+# with the hotel each guild verifies against, the checkpoints of running audits and the Habbo account every
+# member was last verified as. Writes are buffered and flushed in batches so the store never slows down the commands
+
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from config import STORAGE_PATH, STORAGE_BATCH_SIZE, STORAGE_FLUSH_INTERVAL
+
+# Fields of a stored verification record (expires_at is a unix timestamp)
+RECORD_FIELDS = ('user_id', 'guild_id', 'channel_id', 'message_id', 'habbo_user', 'code', 'expires_at', 'hotel')
+
+# Fields of a verified identity (verified_at is a unix timestamp)
+IDENTITY_FIELDS = ('user_id', 'hotel', 'habbo_name', 'verified_at')
+
+
+# Storage backend interface
+class VerificationStore:
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    # Queue a record to be saved (replaces any record of the same user)
+    def save(self, record):
+        raise NotImplementedError
+
+    # Queue the record of a user to be removed
+    def delete(self, user_id):
+        raise NotImplementedError
+
+    async def flush(self):
+        pass
+
+    async def get(self, user_id):
+        raise NotImplementedError
+
+    # Remove expired records and return how many were removed
+    async def expire(self, now):
+        raise NotImplementedError
+
+    # Remove expired records and return the ones still pending
+    async def load_pending(self, now):
+        raise NotImplementedError
+
+    # Hotel chosen by every guild that changed it: {guild_id: hotel}
+    async def load_guild_hotels(self):
+        raise NotImplementedError
+
+    async def save_guild_hotel(self, guild_id, hotel):
+        raise NotImplementedError
+
+    # Progress of an interrupted audit of a guild (a dict), None when there is none
+    async def load_audit_checkpoint(self, guild_id):
+        raise NotImplementedError
+
+    # Save the progress of an audit, or remove it when checkpoint is None
+    async def save_audit_checkpoint(self, guild_id, checkpoint):
+        raise NotImplementedError
+
+    # Identity a user was last verified as (a dict of IDENTITY_FIELDS), None when there is none
+    async def get_identity(self, user_id):
+        raise NotImplementedError
+
+    # Save identity rows (tuples of IDENTITY_FIELDS), replacing those of the same users
+    async def save_identities(self, rows):
+        raise NotImplementedError
+
+    # Remove the identities of the given users (e.g. flagged by an audit)
+    async def delete_identities(self, user_ids):
+        raise NotImplementedError
+
+    # Up to limit identity rows with a user id above after, in user id order (for paging through all of them)
+    async def load_identities(self, after=0, limit=10000):
+        raise NotImplementedError
+
+
+# Store that only keeps records in memory (nothing survives a restart)
+class MemoryVerificationStore(VerificationStore):
+    def __init__(self):
+        self._records = {}
+        self._guild_hotels = {}
+        self._audits = {}
+        self._identities = {}
+
+    def save(self, record):
+        self._records[record['user_id']] = dict(record)
+
+    def delete(self, user_id):
+        self._records.pop(user_id, None)
+
+    async def get(self, user_id):
+        return self._records.get(user_id)
+
+    async def expire(self, now):
+        expired = [user_id for user_id, record in self._records.items() if record['expires_at'] <= now]
+        for user_id in expired:
+            del self._records[user_id]
+        return len(expired)
+
+    async def load_pending(self, now):
+        await self.expire(now)
+        return list(self._records.values())
+
+    async def load_guild_hotels(self):
+        return dict(self._guild_hotels)
+
+    async def save_guild_hotel(self, guild_id, hotel):
+        self._guild_hotels[guild_id] = hotel
+
+    async def load_audit_checkpoint(self, guild_id):
+        checkpoint = self._audits.get(guild_id)
+        return dict(checkpoint) if checkpoint is not None else None
+
+    async def save_audit_checkpoint(self, guild_id, checkpoint):
+        if checkpoint is None:
+            self._audits.pop(guild_id, None)
+        else:
+            self._audits[guild_id] = dict(checkpoint)
+
+    async def get_identity(self, user_id):
+        row = self._identities.get(user_id)
+        return dict(zip(IDENTITY_FIELDS, row)) if row is not None else None
+
+    async def save_identities(self, rows):
+        for row in rows:
+            self._identities[row[0]] = tuple(row)
+
+    async def delete_identities(self, user_ids):
+        for user_id in user_ids:
+            self._identities.pop(user_id, None)
+
+    async def load_identities(self, after=0, limit=10000):
+        return sorted(row for user_id, row in self._identities.items() if user_id > after)[:limit]
+
+
+# Embedded SQLite store in WAL mode, all queries run on one background thread
+class SQLiteVerificationStore(VerificationStore):
+    def __init__(self, path, batch_size=STORAGE_BATCH_SIZE, flush_interval=STORAGE_FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # user_id -> record to save, or None to delete
+        self._pending = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='storage')
+        self._conn = None
+        self._task = None
+        self._wakeup = None
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS pending_verifications ('
+            'user_id INTEGER PRIMARY KEY, guild_id INTEGER, channel_id INTEGER, message_id INTEGER, '
+            'habbo_user TEXT NOT NULL, code TEXT NOT NULL, expires_at REAL NOT NULL, hotel TEXT)'
+        )
+        # Databases created before multi-hotel support don't have the hotel column
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(pending_verifications)')]
+        if 'hotel' not in columns:
+            conn.execute('ALTER TABLE pending_verifications ADD COLUMN hotel TEXT')
+        conn.execute('CREATE INDEX IF NOT EXISTS pending_expires_at ON pending_verifications (expires_at)')
+        conn.execute('CREATE TABLE IF NOT EXISTS guild_settings (guild_id INTEGER PRIMARY KEY, hotel TEXT)')
+        conn.execute('CREATE TABLE IF NOT EXISTS audit_checkpoints (guild_id INTEGER PRIMARY KEY, state TEXT NOT NULL)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS verified_identities ('
+            'user_id INTEGER PRIMARY KEY, hotel TEXT NOT NULL, habbo_name TEXT NOT NULL, verified_at REAL NOT NULL)'
+        )
+        conn.commit()
+        self._conn = conn
+
+    async def start(self):
+        if self._conn is None:
+            await self._run(self._open)
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None:
+            await self.flush()
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
+    def save(self, record):
+        self._pending[record['user_id']] = tuple(record[field] for field in RECORD_FIELDS)
+        if len(self._pending) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def delete(self, user_id):
+        self._pending[user_id] = None
+        if len(self._pending) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _flush_loop(self):
+        while True:
+            # asyncio.wait doesn't swallow a cancel (close) that arrives as the event is set, like wait_for
+            # does before Python 3.12
+            wakeup = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait({wakeup}, timeout=self.flush_interval)
+            finally:
+                wakeup.cancel()
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except sqlite3.Error as e:
+                print(f"Error saving verifications: {e}")
+
+    # Write every queued change in one transaction
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        await self._run(self._write, batch)
+
+    def _write(self, batch):
+        rows = [row for row in batch.values() if row is not None]
+        removed = [(user_id,) for user_id, row in batch.items() if row is None]
+        with self._conn:
+            if removed:
+                self._conn.executemany('DELETE FROM pending_verifications WHERE user_id = ?', removed)
+            if rows:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO pending_verifications VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows
+                )
+
+    def _select(self, query, args):
+        return [dict(zip(RECORD_FIELDS, row)) for row in self._conn.execute(query, args)]
+
+    def _execute(self, query, args=()):
+        with self._conn:
+            return self._conn.execute(query, args).fetchall()
+
+    async def get(self, user_id):
+        if user_id in self._pending:
+            row = self._pending[user_id]
+            return dict(zip(RECORD_FIELDS, row)) if row is not None else None
+        rows = await self._run(self._select, 'SELECT * FROM pending_verifications WHERE user_id = ?', (user_id,))
+        return rows[0] if rows else None
+
+    def _expire(self, now):
+        with self._conn:
+            return self._conn.execute('DELETE FROM pending_verifications WHERE expires_at <= ?', (now,)).rowcount
+
+    async def expire(self, now):
+        await self.flush()
+        return await self._run(self._expire, now)
+
+    async def load_pending(self, now):
+        await self.expire(now)
+        return await self._run(self._select, 'SELECT * FROM pending_verifications', ())
+
+    async def load_guild_hotels(self):
+        return dict(await self._run(self._execute, 'SELECT guild_id, hotel FROM guild_settings WHERE hotel IS NOT NULL'))
+
+    # Written right away, guild settings change rarely
+    async def save_guild_hotel(self, guild_id, hotel):
+        await self._run(self._execute, 'INSERT OR REPLACE INTO guild_settings (guild_id, hotel) VALUES (?, ?)',
+                        (guild_id, hotel))
+
+    async def load_audit_checkpoint(self, guild_id):
+        rows = await self._run(self._execute, 'SELECT state FROM audit_checkpoints WHERE guild_id = ?', (guild_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    async def save_audit_checkpoint(self, guild_id, checkpoint):
+        if checkpoint is None:
+            await self._run(self._execute, 'DELETE FROM audit_checkpoints WHERE guild_id = ?', (guild_id,))
+        else:
+            await self._run(self._execute, 'INSERT OR REPLACE INTO audit_checkpoints (guild_id, state) VALUES (?, ?)',
+                            (guild_id, json.dumps(checkpoint)))
+
+    async def get_identity(self, user_id):
+        rows = await self._run(self._execute, 'SELECT * FROM verified_identities WHERE user_id = ?', (user_id,))
+        return dict(zip(IDENTITY_FIELDS, rows[0])) if rows else None
+
+    def _save_identities(self, rows):
+        with self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO verified_identities VALUES (?, ?, ?, ?)', rows)
+
+    # Written right away in one transaction (a single verification or a chunk of a bulk import)
+    async def save_identities(self, rows):
+        await self._run(self._save_identities, rows)
+
+    def _delete_identities(self, user_ids):
+        with self._conn:
+            self._conn.executemany('DELETE FROM verified_identities WHERE user_id = ?', [(user_id,) for user_id in user_ids])
+
+    async def delete_identities(self, user_ids):
+        await self._run(self._delete_identities, user_ids)
+
+    async def load_identities(self, after=0, limit=10000):
+        return await self._run(self._execute, 'SELECT * FROM verified_identities WHERE user_id > ? ORDER BY user_id LIMIT ?',
+                               (after, limit))
+
+
+# Open the configured store (an empty path keeps verifications in memory only)
+def open_store(path=STORAGE_PATH):
+    if path:
+        return SQLiteVerificationStore(path)
+    return MemoryVerificationStore()
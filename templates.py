@@ -0,0 +1,232 @@
+# Message templates
+# Loads messages.json once, checks every template against the placeholders its call site supplies and
+# precompiles it. The file is reloaded in the background when it changes, and guilds whose Discord locale
+# has a file in the locales folder (e.g. locales/pt-BR.json) get its messages, loaded on first use
+
+import asyncio
+import json
+import os
+import string
+
+from config import MESSAGES_FILE, LOCALES_DIR, TEMPLATE_RELOAD_INTERVAL
+
+# Placeholders supplied by the call site of every template: {(section, key): placeholders}
+TEMPLATE_FIELDS = {
+    ('bot', 'online'): {'bot_name'},
+    ('bot', 'id'): {'bot_id'},
+    ('verify', 'no_username'): {'mention', 'prefix', 'command'},
+    ('verify', 'already_in_progress'): {'mention', 'prefix'},
+    ('verify', 'instructions'): {'mention', 'habbo_user', 'hotel', 'code', 'expiration_minutes', 'prefix'},
+    ('verify', 'unknown_hotel'): {'mention', 'hotel', 'hotels'},
+    ('verification_process', 'user_not_found'): {'mention', 'habbo_user', 'hotel'},
+    ('verification_process', 'bot_no_permission'): {'mention'},
+    ('verification_process', 'role_hierarchy_error'): {'mention', 'role_name'},
+    ('verification_process', 'role_assign_error'): {'mention', 'role_name'},
+    ('verification_process', 'success_with_nickname'): {'mention', 'habbo_user'},
+    ('verification_process', 'success'): {'mention'},
+    ('verification_process', 'error'): {'mention', 'error'},
+    ('verification_process', 'expired'): {'mention', 'prefix', 'command', 'habbo_user'},
+    ('cancel', 'success'): {'mention'},
+    ('cancel', 'no_verification'): {'mention'},
+    ('restart', 'in_progress'): {'mention', 'habbo_user'},
+    ('restart', 'instructions'): {'mention', 'habbo_user', 'hotel', 'code', 'interval', 'expiration_minutes',
+                                  'prefix'},
+    ('restart', 'no_verification'): {'mention'},
+    ('hotel', 'current'): {'mention', 'hotel', 'hotels'},
+    ('hotel', 'changed'): {'mention', 'hotel'},
+    ('hotel', 'no_permission'): {'mention'},
+    ('audit', 'progress'): {'scanned', 'checked', 'ok', 'missing', 'mismatch', 'errors', 'stripped'},
+    ('audit', 'finished'): {'mention', 'scanned', 'checked', 'ok', 'missing', 'mismatch', 'errors', 'stripped'},
+    ('audit', 'stopped'): {'mention'},
+    ('audit', 'error'): {'mention', 'error'},
+    ('audit', 'no_permission'): {'mention'},
+    ('audit', 'no_audit'): {'mention'},
+    ('audit', 'usage'): {'mention', 'prefix'},
+    ('audit', 'already_running'): {'mention', 'prefix'},
+    ('audit', 'no_role'): {'mention', 'role_name'},
+    ('audit', 'strip_needs_nickname'): {'mention', 'prefix'}
+}
+
+CONVERSIONS = {'s': str, 'r': repr, 'a': ascii}
+
+
+class TemplateError(Exception):
+    """Raised for a missing or malformed template, or a call site that doesn't supply its placeholders."""
+
+
+# A template parsed once into literal text and (placeholder, conversion, format spec) parts
+class Template:
+    __slots__ = ('text', 'parts', 'fields')
+
+    def __init__(self, text, name):
+        if not isinstance(text, str):
+            raise TemplateError(f"Template {name} must be a string")
+        self.text = text
+        self.parts = []
+        self.fields = set()
+        try:
+            parsed = list(string.Formatter().parse(text))
+        except ValueError as e:
+            raise TemplateError(f"Template {name} is malformed: {e}") from e
+        for literal, field, format_spec, conversion in parsed:
+            if literal:
+                self.parts.append(literal)
+            if field is None:
+                continue
+            if not field.isidentifier():
+                raise TemplateError(f"Template {name} has an invalid placeholder {{{field}}}")
+            if format_spec and '{' in format_spec:
+                raise TemplateError(f"Template {name} has a nested placeholder in {{{field}}}")
+            if conversion is not None and conversion not in CONVERSIONS:
+                raise TemplateError(f"Template {name} has an invalid conversion !{conversion}")
+            self.parts.append((field, CONVERSIONS.get(conversion), format_spec or ''))
+            self.fields.add(field)
+
+    def render(self, values):
+        output = []
+        for part in self.parts:
+            if isinstance(part, str):
+                output.append(part)
+                continue
+            field, conversion, format_spec = part
+            value = values[field]
+            if conversion is not None:
+                value = conversion(value)
+            output.append(format(value, format_spec))
+        return ''.join(output)
+
+
+# Compile the templates of a messages file, every template must use only the placeholders of its call site
+# When partial is false (messages.json) every template must be present, locale files may override only some
+def compile_templates(data, source, partial=False):
+    if not isinstance(data, dict):
+        raise TemplateError(f"{source} must contain an object of sections")
+    templates = {}
+    for section, messages in data.items():
+        if not isinstance(messages, dict):
+            raise TemplateError(f"Section '{section}' of {source} must be an object")
+        for key, text in messages.items():
+            fields = TEMPLATE_FIELDS.get((section, key))
+            if fields is None:
+                print(f"Unknown template {section}.{key} in {source} is ignored")
+                continue
+            template = Template(text, f"{section}.{key} in {source}")
+            unknown = template.fields - fields
+            if unknown:
+                raise TemplateError(f"Template {section}.{key} in {source} uses unknown placeholders "
+                                    f"{', '.join(sorted(unknown))} (available: {', '.join(sorted(fields))})")
+            templates[(section, key)] = template
+
+    missing = [f"{section}.{key}" for section, key in TEMPLATE_FIELDS if (section, key) not in templates]
+    if missing and not partial:
+        raise TemplateError(f"{source} is missing templates: {', '.join(missing)}")
+    return templates
+
+
+def _read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return os.fstat(f.fileno()).st_mtime, json.load(f)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class TemplateRegistry:
+    def __init__(self, path=MESSAGES_FILE, locales_dir=LOCALES_DIR, reload_interval=TEMPLATE_RELOAD_INTERVAL):
+        self.path = path
+        self.locales_dir = locales_dir
+        self.reload_interval = reload_interval
+        self._templates = {}
+        self._mtime = None
+        # locale -> (mtime, templates), templates is None when the locale has no usable file
+        self._locales = {}
+        self._task = None
+
+    def _locale_path(self, locale):
+        return os.path.join(self.locales_dir, f"{locale}.json")
+
+    # Load and check messages.json, raises TemplateError so a broken file stops the bot at startup
+    def load(self):
+        try:
+            mtime, data = _read(self.path)
+        except (OSError, ValueError) as e:
+            raise TemplateError(f"Could not load {self.path}: {e}") from e
+        self._templates = compile_templates(data, self.path)
+        self._mtime = mtime
+
+    def _load_locale(self, locale):
+        path = self._locale_path(locale)
+        try:
+            mtime, data = _read(path)
+        except FileNotFoundError:
+            return None, None
+        except (OSError, ValueError) as e:
+            print(f"Error loading {path}: {e}")
+            return _mtime(path), None
+        try:
+            return mtime, compile_templates(data, path, partial=True)
+        except TemplateError as e:
+            print(f"Error loading {path}: {e}")
+            return mtime, None
+
+    def _locale_templates(self, locale):
+        cached = self._locales.get(locale)
+        if cached is None:
+            # First message in this locale, the file is small and read only once
+            cached = self._locales[locale] = self._load_locale(locale)
+        return cached[1]
+
+    # Render a template, in the locale of the guild when it has its own messages
+    def render(self, section, key, guild=None, **values):
+        name = (section, key)
+        fields = TEMPLATE_FIELDS.get(name)
+        if fields is None:
+            raise TemplateError(f"Unknown template {section}.{key}")
+        if not fields <= values.keys():
+            raise TemplateError(f"Template {section}.{key} needs {', '.join(sorted(fields - values.keys()))}")
+
+        template = None
+        locale = getattr(guild, 'preferred_locale', None)
+        if locale is not None and self.locales_dir:
+            templates = self._locale_templates(str(locale))
+            if templates is not None:
+                template = templates.get(name)
+        if template is None:
+            template = self._templates[name]
+        return template.render(values)
+
+    # Reload files that changed since they were read, keeping the old templates when the new ones are broken
+    async def refresh(self):
+        loop = asyncio.get_running_loop()
+        mtime = await loop.run_in_executor(None, _mtime, self.path)
+        if mtime is not None and mtime != self._mtime:
+            try:
+                _, data = await loop.run_in_executor(None, _read, self.path)
+                self._templates = compile_templates(data, self.path)
+                print(f"Reloaded {self.path}")
+            except (OSError, ValueError, TemplateError) as e:
+                print(f"Error reloading {self.path}, keeping the previous messages: {e}")
+            self._mtime = mtime
+
+        for locale, (old_mtime, _) in list(self._locales.items()):
+            mtime = await loop.run_in_executor(None, _mtime, self._locale_path(locale))
+            if mtime != old_mtime:
+                self._locales[locale] = await loop.run_in_executor(None, self._load_locale, locale)
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            await self.refresh()
+
+    def start(self):
+        if self.reload_interval and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._watch())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None